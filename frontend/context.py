@@ -0,0 +1,99 @@
+import math
+import re
+
+from retriever.batching import CHARS_PER_TOKEN, estimate_tokens
+
+WORD_RE = re.compile(r"\w+")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "how", "in", "is", "it",
+    "of", "on", "or", "that", "the", "this", "to", "was", "what", "when", "where", "which",
+    "who", "why", "with", "you", "your", "i", "do", "does", "can",
+}
+
+
+def terms(text):
+    return [w for w in WORD_RE.findall(text.lower()) if w not in STOPWORDS]
+
+
+def split_chunks(text, chunk_tokens=200):
+    """Splits text on blank lines, then packs/cuts paragraphs into chunks of about chunk_tokens."""
+    max_chars = chunk_tokens * CHARS_PER_TOKEN
+    chunks = []
+    current = ""
+    for para in re.split(r"\n\s*\n", text):
+        para = para.strip()
+        if not para:
+            continue
+        while len(para) > max_chars:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(para[:max_chars])
+            para = para[max_chars:]
+        if current and len(current) + len(para) + 2 > max_chars:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n\n{para}" if current else para
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def best_chunk(query_terms, text, chunk_tokens=200):
+    """Returns the chunk of text sharing the most query terms (length-normalized); the first chunk wins ties."""
+    chunks = split_chunks(text, chunk_tokens)
+    if not chunks:
+        return ""
+    best, best_score = chunks[0], -1.0
+    for chunk in chunks:
+        chunk_terms = terms(chunk)
+        if not chunk_terms:
+            continue
+        hits = sum(1 for t in chunk_terms if t in query_terms)
+        score = hits / math.sqrt(len(chunk_terms))
+        if score > best_score:
+            best, best_score = chunk, score
+    return best
+
+
+def shingles(text, n=3, max_words=300):
+    words = terms(text)[:max_words]
+    if len(words) < n:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + n]) for i in range(len(words) - n + 1)}
+
+
+def build_context(query, docs, max_tokens=750, chunk_tokens=200, dedup_threshold=0.8):
+    """
+    Assembles the prompt context from docs (in rank order) within a token budget:
+    near-duplicate documents (shingle Jaccard >= dedup_threshold) are skipped and only
+    the most query-relevant chunk of each document is included.
+    A doc may carry a "passage" field (the retrieved passage), which is used as-is.
+    """
+    query_terms = set(terms(query))
+    seen = []
+    parts = []
+    budget = max_tokens
+    for d in docs:
+        title = d.get("title") or ""
+        text = d.get("text") or ""
+
+        doc_shingles = shingles(title + " " + text)
+        if any(len(doc_shingles & s) / max(len(doc_shingles | s), 1) >= dedup_threshold for s in seen):
+            continue
+        seen.append(doc_shingles)
+
+        passage = d.get("passage") or best_chunk(query_terms, text, chunk_tokens)
+        entry = f"Title: {title}\nContent: {passage}"
+        cost = estimate_tokens(entry)
+        if cost > budget:
+            # 预算不够整段时截断最后一段，太短则停止
+            if budget < 50:
+                break
+            entry = entry[: budget * CHARS_PER_TOKEN]
+            cost = budget
+        parts.append(entry)
+        budget -= cost
+        if budget <= 0:
+            break
+    return "\n\n".join(parts)
@@ -0,0 +1,185 @@
+import asyncio
+import json
+import logging
+import random
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASE_URL = "https://openrouter.ai/api/v1"
+DEFAULT_MODEL = "shisa-ai/shisa-v2-llama3.3-70b:free"
+
+# 这些状态码视为暂时性错误，可以重试
+RETRY_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    pass
+
+
+class LLMClient:
+    """
+    Async chat-completions client with a pooled aiohttp session, per-request timeout,
+    bounded concurrency and retry with exponential backoff.
+
+    The session is bound to the event loop that first uses it; if a call arrives on a
+    different loop, the old session is closed and a new one is opened for that loop.
+    """
+
+    def __init__(
+        self,
+        api_key,
+        base_url=DEFAULT_BASE_URL,
+        model=DEFAULT_MODEL,
+        timeout=120.0,
+        max_concurrency=8,
+        max_retries=3,
+        backoff=0.5,
+        extra_headers=None,
+    ):
+        self.api_key = api_key
+        self.url = base_url.rstrip("/") + "/chat/completions"
+        self.model = model
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json",
+            **(extra_headers or {}),
+        }
+        self._session = None
+        self._semaphore = None
+        self._loop = None
+
+    async def _ensure_session(self):
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            old_session, old_loop = self._session, self._loop
+            self._loop = loop
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_concurrency),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers=self.headers,
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            if old_session is not None and not old_session.closed:
+                await self._close_session(old_session, old_loop)
+        return self._session
+
+    @staticmethod
+    async def _close_session(session, loop):
+        """Closes a session opened on another event loop."""
+        if loop.is_running():
+            # 旧 loop 仍在别的线程上运行：交给它自己关闭连接
+            asyncio.run_coroutine_threadsafe(session.close(), loop)
+        else:
+            await session.close()
+
+    def _payload(self, prompt, **kwargs):
+        return {
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}],
+            **kwargs,
+        }
+
+    async def _sleep_before_retry(self, attempt, retry_after=None):
+        delay = self.backoff * (2 ** attempt) * (1 + random.random() * 0.1)
+        if retry_after is not None:
+            try:
+                delay = max(delay, float(retry_after))
+            except ValueError:
+                pass
+        await asyncio.sleep(delay)
+
+    async def complete(self, prompt, **kwargs):
+        """Sends one chat completion and returns the message content."""
+        session = await self._ensure_session()
+        payload = self._payload(prompt, **kwargs)
+        async with self._semaphore:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    async with session.post(self.url, data=json.dumps(payload)) as response:
+                        if response.status in RETRY_STATUS and attempt < self.max_retries:
+                            logger.warning(f"LLM request got HTTP {response.status}, retrying...")
+                            await self._sleep_before_retry(attempt, response.headers.get("Retry-After"))
+                            continue
+                        body = await response.text()
+                        if response.status != 200:
+                            raise LLMError(f"HTTP {response.status}: {body[:200]}")
+                        res_json = json.loads(body)
+                        return res_json["choices"][0]["message"]["content"]
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    if attempt >= self.max_retries:
+                        raise LLMError(f"{type(e).__name__}: {e}") from e
+                    logger.warning(f"LLM request failed ({e!r}), retrying...")
+                    await self._sleep_before_retry(attempt)
+                except (KeyError, IndexError, ValueError) as e:
+                    raise LLMError(f"Malformed response: {e}") from e
+        raise LLMError("LLM request failed after retries")
+
+    async def stream(self, prompt, **kwargs):
+        """
+        Streams one chat completion over server-sent events, yielding content deltas as they arrive.
+        Retries only happen before the first token has been yielded.
+        """
+        session = await self._ensure_session()
+        payload = self._payload(prompt, stream=True, **kwargs)
+        # 流式响应可能很长：不限总时长，只限制两次读取之间的间隔
+        stream_timeout = aiohttp.ClientTimeout(total=None, sock_connect=self.timeout, sock_read=self.timeout)
+        async with self._semaphore:
+            for attempt in range(self.max_retries + 1):
+                started = False
+                try:
+                    async with session.post(self.url, data=json.dumps(payload), timeout=stream_timeout) as response:
+                        if response.status in RETRY_STATUS and attempt < self.max_retries:
+                            logger.warning(f"LLM stream got HTTP {response.status}, retrying...")
+                            await self._sleep_before_retry(attempt, response.headers.get("Retry-After"))
+                            continue
+                        if response.status != 200:
+                            body = await response.text()
+                            raise LLMError(f"HTTP {response.status}: {body[:200]}")
+                        async for delta in self._iter_sse(response):
+                            started = True
+                            yield delta
+                        return
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    if started or attempt >= self.max_retries:
+                        raise LLMError(f"{type(e).__name__}: {e}") from e
+                    logger.warning(f"LLM stream failed ({e!r}), retrying...")
+                    await self._sleep_before_retry(attempt)
+        raise LLMError("LLM stream failed after retries")
+
+    async def _iter_sse(self, response):
+        async for raw in response.content:
+            line = raw.decode("utf-8").strip()
+            # 只处理 data 行；空行是事件分隔，冒号开头是注释（如 OpenRouter 的 keep-alive）
+            if not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                return
+            try:
+                chunk = json.loads(data)
+            except ValueError as e:
+                raise LLMError(f"Malformed stream chunk: {data[:200]}") from e
+            if "error" in chunk:
+                raise LLMError(str(chunk["error"]))
+            choices = chunk.get("choices") or [{}]
+            delta = (choices[0].get("delta") or {}).get("content")
+            if delta:
+                yield delta
+
+    async def complete_many(self, prompts, **kwargs):
+        """Runs several completions concurrently; failed ones come back as LLMError instances."""
+        return await asyncio.gather(
+            *(self.complete(prompt, **kwargs) for prompt in prompts),
+            return_exceptions=True,
+        )
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
@@ -0,0 +1,103 @@
+"""
+Local stand-in for the chat-completions endpoint, for trying the frontend without OpenRouter.
+
+    python frontend/llm_stub.py --port 8001
+    OPENROUTER_API_KEY=stub LLM_BASE_URL=http://127.0.0.1:8001/v1 python frontend/main.py
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubLLMHandler(BaseHTTPRequestHandler):
+    # 由 serve() 设置
+    delay = 0.0
+    token_delay = 0.0
+    fail_first = 0
+    requests_seen = 0
+    lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, n, model, answer):
+        # 按词切分，模拟逐 token 的 SSE 输出
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.wfile.write(b": stub processing\n\n")
+        words = answer.split(" ")
+        for i, word in enumerate(words):
+            chunk = {
+                "id": f"stub-{n}",
+                "object": "chat.completion.chunk",
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": word if i == 0 else " " + word}}],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            time.sleep(self.token_delay)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        if not self.path.endswith("/chat/completions"):
+            self._send_json(404, {"error": "not found"})
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+
+        with self.lock:
+            type(self).requests_seen += 1
+            n = type(self).requests_seen
+        if n <= self.fail_first:
+            self._send_json(503, {"error": "stub overloaded"})
+            return
+        time.sleep(self.delay)
+
+        prompt = payload.get("messages", [{}])[-1].get("content", "")
+        answer = f"Stub answer ({len(prompt)} prompt chars)."
+        if payload.get("stream"):
+            self._send_stream(n, payload.get("model", "stub"), answer)
+            return
+        self._send_json(200, {
+            "id": f"stub-{n}",
+            "object": "chat.completion",
+            "model": payload.get("model", "stub"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": answer}, "finish_reason": "stop"}],
+        })
+
+
+def serve(host="127.0.0.1", port=0, delay=0.0, token_delay=0.0, fail_first=0):
+    """Starts the stub on a background thread; returns (server, base_url)."""
+    handler = type("Handler", (StubLLMHandler,), {
+        "delay": delay, "token_delay": token_delay, "fail_first": fail_first, "requests_seen": 0,
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--delay", type=float, default=0.5)
+    parser.add_argument("--token-delay", type=float, default=0.05)
+    args = parser.parse_args()
+    server, base_url = serve(port=args.port, delay=args.delay, token_delay=args.token_delay)
+    print(f"Stub LLM listening on {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
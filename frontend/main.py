@@ -1,94 +1,103 @@
 import gradio as gr
+import asyncio
 import sys
 import os
-import requests
-import json
+import time
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
-from retriever.main import get_searcher_and_corpus, rag_retrieve
+from retriever import metrics
+from retriever.main import start_warmup, is_ready, get_warmup_error, rag_retrieve
 from frontend.components import floating_scroll_button
+from frontend.context import build_context
+from frontend.llm_client import LLMClient, LLMError, DEFAULT_BASE_URL
+
+API_KEY = os.environ.get("OPENROUTER_API_KEY")
+if not API_KEY:
+    raise SystemExit("❌ OPENROUTER_API_KEY is not set. Export your OpenRouter API key before starting the frontend.")
+
+# 连接池复用的 LLM 客户端；LLM_BASE_URL 可指向本地 stub（frontend/llm_stub.py）
+llm_client = LLMClient(
+    api_key=API_KEY,
+    base_url=os.environ.get("LLM_BASE_URL", DEFAULT_BASE_URL),
+    extra_headers={
+        "HTTP-Referer": "https://yourdomain.com",
+        "X-Title": "LLaMA-Demo",
+    },
+)
 
 
-get_searcher_and_corpus()
+# RAG prompt 中检索文档部分的 token 预算
+CONTEXT_TOKENS = int(os.environ.get("RAG_CONTEXT_TOKENS", 750))
 
-API_KEY = "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"
 
-# 调用 LLaMA，只提问
-def call_llama_only_query(query):
-    prompt = f"""You are a helpful assistant. Please answer the user's question clearly and concisely.
+# 只提问
+def build_query_prompt(query):
+    return f"""You are a helpful assistant. Please answer the user's question clearly and concisely.
 
 User Question:
 {query}
 """
-    headers = {
-        "Authorization": f"Bearer {API_KEY}",
-        "Content-Type": "application/json",
-        "HTTP-Referer": "https://yourdomain.com",
-        "X-Title": "LLaMA-Demo",
-    }
 
-    payload = {
-        "model": "shisa-ai/shisa-v2-llama3.3-70b:free",
-        "messages": [{"role": "user", "content": prompt}]
-    }
 
-    response = requests.post(
-        url="https://openrouter.ai/api/v1/chat/completions",
-        headers=headers,
-        data=json.dumps(payload)
-    )
-
-    try:
-        res_json = response.json()
-        return res_json["choices"][0]["message"]["content"]
-    except Exception as e:
-        return f"[LLaMA Error] {str(e)}"
-
-def call_llama_with_docs(query, docs):
-    context = "\n\n".join([f"Title: {d['title']}\nContent: {d['text']}" for d in docs])
-    prompt = f"""You are a helpful assistant. Based on the following retrieved documents, answer the user's question.
+def build_rag_prompt(query, docs):
+    # 按 token 预算挑选每篇文档最相关的片段，并去掉近似重复的文档
+    context = build_context(query, docs, max_tokens=CONTEXT_TOKENS)
+    return f"""You are a helpful assistant. Based on the following retrieved documents, answer the user's question.
 
 User Question:
 {query}
 
 Retrieved Documents:
-{context[:3000]}
+{context}
 
 Please provide a helpful and concise answer based on the content above.
 """
-    headers = {
-        "Authorization": f"Bearer {API_KEY}",
-        "Content-Type": "application/json",
-        "HTTP-Referer": "https://yourdomain.com",
-        "X-Title": "LLaMA-Demo",
-    }
-
-    payload = {
-        "model": "shisa-ai/shisa-v2-llama3.3-70b:free",
-        "messages": [{"role": "user", "content": prompt}]
-    }
 
-    response = requests.post(
-        url="https://openrouter.ai/api/v1/chat/completions",
-        headers=headers,
-        data=json.dumps(payload)
-    )
 
+async def stream_llm(name, prompt, queue):
+    """Pushes (name, delta) for each streamed token, then (name, None) when finished."""
+    # 协程共用线程，不能用 metrics.span 的线程栈，直接记录耗时
+    start = time.perf_counter()
+    first_token = True
+    status = "ok"
     try:
-        res_json = response.json()
-        return res_json["choices"][0]["message"]["content"]
+        async for delta in llm_client.stream(prompt):
+            if first_token:
+                metrics.observe(f"llm_first_token_{name}", time.perf_counter() - start)
+                first_token = False
+            metrics.inc("llm_stream_chunks", prompt=name)
+            await queue.put((name, delta))
+    except LLMError as e:
+        status = "error"
+        await queue.put((name, f"[LLaMA Error] {str(e)}"))
+    finally:
+        metrics.observe(f"llm_stream_{name}", time.perf_counter() - start)
+        metrics.inc("llm_requests", prompt=name, status=status)
+        await queue.put((name, None))
+
+
+async def retrieve_and_stream(query, queue):
+    """Retrieves documents, pushes ("docs", docs), then streams the RAG answer as "rag"."""
+    if not is_ready():
+        error = get_warmup_error()
+        if error is not None:
+            await queue.put(("rag", f"[Retriever Error] Retriever warm-up failed: {error}"))
+        else:
+            await queue.put(("rag", "⏳ Retriever is still warming up, please try again in a moment."))
+        await queue.put(("rag", None))
+        return
+    try:
+        # rag_retrieve 是阻塞调用，放到线程里执行
+        docs = await asyncio.to_thread(rag_retrieve, query)
     except Exception as e:
-        return f"[LLaMA Error] {str(e)}"
+        await queue.put(("rag", f"[Retriever Error] {str(e)}"))
+        await queue.put(("rag", None))
+        return
+    await queue.put(("docs", docs))
+    await stream_llm("rag", build_rag_prompt(query, docs), queue)
 
-def handle_user_only(query, history):
-    history = history or []
-    user_answer = call_llama_only_query(query)
-    history.append(f"<p><strong>You asked:</strong> {query}</p>")
-    return "\n\n---\n\n".join(history), history, user_answer, ""
-
-def handle_rag_and_docs(query, history):
-    docs = rag_retrieve(query)
 
+def render_docs(docs):
     doc_texts = []
     for d in docs:
         preview = d["text"][:100]
@@ -100,13 +109,41 @@ def handle_rag_and_docs(query, history):
             </details>
         """
         doc_texts.append(entry)
+    return f"<p><strong>Retrieved Documents:</strong></p>" + "\n".join(doc_texts)
+
 
+async def handle_query(query, history):
+    """
+    Generator handler: shows the question at once, the retrieved documents as soon as
+    rag_retrieve returns, and both answers token by token while they stream in.
+    """
     history = history or []
-    history.append(
-        f"<p><strong>Retrieved Documents:</strong></p>" + "\n".join(doc_texts)
-    )
-    rag_answer = call_llama_with_docs(query, docs)
-    return "\n\n---\n\n".join(history), history, rag_answer
+    history.append(f"<p><strong>You asked:</strong> {query}</p>")
+    answers = {"only": "", "rag": ""}
+    yield "\n\n---\n\n".join(history), history, answers["only"], answers["rag"]
+
+    # 只提问与 RAG 两路并发，token 汇入同一个队列
+    queue = asyncio.Queue()
+    tasks = [
+        asyncio.create_task(stream_llm("only", build_query_prompt(query), queue)),
+        asyncio.create_task(retrieve_and_stream(query, queue)),
+    ]
+    pending = 2
+    try:
+        while pending:
+            name, item = await queue.get()
+            if item is None:
+                pending -= 1
+                continue
+            if name == "docs":
+                history.append(render_docs(item))
+            else:
+                answers[name] += item
+            yield "\n\n---\n\n".join(history), history, answers["only"], answers["rag"]
+    finally:
+        for task in tasks:
+            task.cancel()
+
 
 with gr.Blocks() as demo:
     gr.Markdown("## 📚 COMP 631 Chatbot with LLaMA AI")
@@ -125,20 +162,17 @@ with gr.Blocks() as demo:
 
     state = gr.State([])
 
-    # 只提问的回答
-    submit.click(handle_user_only, [textbox, state],
+    # 只提问与 RAG 的回答在同一个回调里并发流式输出
+    submit.click(handle_query, [textbox, state],
                  [output_history, state, output_answer_only, output_answer_rag])
-
-    # RAG的回答
-    submit.click(handle_rag_and_docs, [textbox, state],
-                 [output_history, state, output_answer_rag])
-
-    textbox.submit(handle_user_only, [textbox, state],
+    textbox.submit(handle_query, [textbox, state],
                    [output_history, state, output_answer_only, output_answer_rag])
-    textbox.submit(handle_rag_and_docs, [textbox, state],
-                   [output_history, state, output_answer_rag])
 
     clear.click(lambda: ("", [], "", ""), None,
                 [output_history, state, output_answer_only, output_answer_rag])
 
-demo.launch()
+if __name__ == "__main__":
+    # spawn 出的子进程（分片、编码 worker）会重新导入 __main__，不能再次预热和启动 Gradio
+    # 后台加载 corpus / 模型 / 索引，Gradio 可以先绑定端口
+    start_warmup()
+    demo.launch()
@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+# 粗略估计：英文平均每个 token 约 4 个字符
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str, max_seq_length: int | None = None) -> int:
+    """Cheap token count estimate (no tokenizer call), capped at the model's max sequence length if given."""
+    tokens = len(text) // CHARS_PER_TOKEN + 2
+    return tokens if max_seq_length is None else min(max_seq_length, tokens)
+
+
+def token_budget_batches(lengths: list[int], max_batch_tokens: int, max_batch_size: int) -> list[list[int]]:
+    """
+    Groups indices into batches of similar length, longest first.
+    A batch is closed once len(batch) * longest_in_batch would exceed max_batch_tokens
+    or it holds max_batch_size items, so padding per batch stays small.
+    :return: list of batches, each a list of indices into lengths
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+    batches = []
+    batch = []
+    batch_max = 0
+    for i in order:
+        length = max(lengths[i], 1)
+        new_max = max(batch_max, length)
+        if batch and ((len(batch) + 1) * new_max > max_batch_tokens or len(batch) >= max_batch_size):
+            batches.append(batch)
+            batch, new_max = [], length
+        batch.append(i)
+        batch_max = new_max
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def encode_bucketed(
+    model,
+    texts: list[str],
+    max_batch_tokens: int = 16384,
+    max_batch_size: int = 256,
+    convert_to_tensor: bool = True,
+    **kwargs,
+):
+    """
+    Encodes texts with model.encode() using length-bucketed, token-budgeted batches.
+    Text beyond what the model can see (max_seq_length tokens) is cut before tokenization.
+    Embeddings are returned in the original order of texts.
+    """
+    import torch  # 按需导入：frontend 只用到上面的 token 估计
+
+    if not texts:
+        return model.encode(texts, convert_to_tensor=convert_to_tensor, **kwargs)
+
+    max_seq_length = getattr(model, "max_seq_length", None) or 512
+    char_limit = max_seq_length * CHARS_PER_TOKEN * 2  # 留余量，避免截掉模型本可看到的内容
+    texts = [text[:char_limit] for text in texts]
+
+    lengths = [estimate_tokens(text, max_seq_length) for text in texts]
+    batches = token_budget_batches(lengths, max_batch_tokens, max_batch_size)
+
+    kwargs.pop("batch_size", None)
+    embeddings = []
+    for batch in batches:
+        embeddings.append(model.encode(
+            [texts[i] for i in batch],
+            batch_size=len(batch),
+            convert_to_tensor=True,
+            **kwargs,
+        ).cpu())
+
+    order = torch.tensor([i for batch in batches for i in batch], dtype=torch.long)
+    stacked = torch.cat(embeddings, dim=0)
+    result = torch.empty_like(stacked)
+    result[order] = stacked
+    return result if convert_to_tensor else result.numpy()
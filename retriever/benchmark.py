@@ -0,0 +1,241 @@
+"""
+Retrieval benchmark: index build time, query latency percentiles, QPS per batch size, peak RSS
+and recall@k of each engine against exact cos_sim search. Results are printed as JSON.
+
+Offline, on a synthetic clustered corpus with a stub encoder:
+    python retriever/benchmark.py --docs 100000 --dim 384 --output bench.json
+
+On the real corpus (loads the sentence-transformers model):
+    python retriever/benchmark.py --corpus ./retriever/data/corpus.csv --queries queries.txt
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import torch
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from retriever.main import resolve_search_type
+
+logger = logging.getLogger(__name__)
+
+# engine name -> (search_type, search kwargs)；"exact" 是计算 recall 的基准
+ENGINES = {
+    "exact": ("exact", {}),
+    "exact_blockwise": ("exact", {"score_block_size": 16384}),
+    "float16": ("exact", {"embedding_dtype": "float16", "exact_rerank": False}),
+    "int8": ("exact", {"embedding_dtype": "int8", "exact_rerank": False}),
+    "int8_rerank": ("exact", {"embedding_dtype": "int8"}),
+    "ivf": ("ivf", {"nprobe": 8}),
+    "hybrid": ("hybrid", {}),
+}
+
+
+class StubEncoder:
+    """
+    Encoder over a precomputed embedding table: the text "doc <i>" / "query <i>" maps to row i,
+    so the benchmark measures the index and not a model.
+    """
+
+    def __init__(self, doc_embeddings: torch.Tensor, query_embeddings: torch.Tensor):
+        self.doc_embeddings = doc_embeddings
+        self.query_embeddings = query_embeddings
+
+    @staticmethod
+    def _rows(texts):
+        return [int(t.split()[-1]) for t in texts]
+
+    def encode_queries(self, queries, **kwargs):
+        return self.query_embeddings[self._rows(queries)]
+
+    def encode_corpus(self, corpus, **kwargs):
+        return self.doc_embeddings[self._rows([doc["text"] for doc in corpus])]
+
+
+def synthetic_dataset(n_docs: int, n_queries: int, dim: int, n_clusters: int = 256, noise: float = 0.5, seed: int = 0):
+    """
+    Clustered random embeddings (uniform random vectors are unrealistically hard for IVF).
+    Each query is a perturbed copy of a random document.
+    """
+    generator = torch.Generator().manual_seed(seed)
+    centers = torch.randn(n_clusters, dim, generator=generator)
+    assign = torch.randint(0, n_clusters, (n_docs,), generator=generator)
+    doc_embeddings = centers[assign] + noise * torch.randn(n_docs, dim, generator=generator)
+    source = torch.randint(0, n_docs, (n_queries,), generator=generator)
+    query_embeddings = doc_embeddings[source] + noise * torch.randn(n_queries, dim, generator=generator)
+
+    corpus = {i: {"title": "", "text": f"doc {i}"} for i in range(n_docs)}
+    queries = {f"q{i}": f"query {i}" for i in range(n_queries)}
+    return StubEncoder(doc_embeddings, query_embeddings), corpus, queries
+
+
+def real_dataset(corpus_path: str, queries_path: str | None, model_name: str, n_queries: int, ratio: float):
+    from retriever.main import load_csv_corpus, load_model
+
+    arrow_path = os.path.splitext(corpus_path)[0] + ".arrow"
+    if os.path.exists(arrow_path):
+        from retriever.corpus_store import ArrowCorpus
+
+        corpus = ArrowCorpus(arrow_path)
+        if ratio < 1.0:
+            corpus = ArrowCorpus(arrow_path, limit=int(len(corpus) * ratio))
+    else:
+        corpus = load_csv_corpus(corpus_path, ratio)
+
+    if queries_path:
+        with open(queries_path, "r", encoding="utf-8") as f:
+            lines = [line.strip() for line in f if line.strip()]
+    else:
+        # 没有查询集时用随机文档的标题当 query
+        rng = np.random.default_rng(0)
+        ids = list(corpus)
+        lines = [corpus[ids[i]]["title"] or "" for i in rng.choice(len(ids), size=min(n_queries, len(ids)), replace=False)]
+    queries = {f"q{i}": q for i, q in enumerate(lines[:n_queries]) if q}
+    return load_model(model_name), corpus, queries
+
+
+def peak_rss_mb() -> float:
+    # Linux 上 ru_maxrss 单位是 KB，macOS 上是字节
+    scale = 1 if platform.system() == "Darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2**20
+
+
+def percentiles(samples: list[float]) -> dict[str, float]:
+    values = np.asarray(samples) * 1000
+    return {f"p{p}_ms": float(np.percentile(values, p)) for p in (50, 95, 99)}
+
+
+def recall_at_k(results: dict, reference: dict, top_k: int) -> float:
+    hits = [len(set(results[qid]) & set(reference[qid])) / max(len(reference[qid]), 1) for qid in reference]
+    return float(np.mean(hits)) if hits else 0.0
+
+
+def bench_engine(name, model, model_name, corpus, queries, top_k, batch_sizes, cache_dir, reference=None):
+    search_type, kwargs = ENGINES[name]
+    searcher_cls = resolve_search_type(search_type)
+    # 关闭 query/result 缓存，测的是每次真实的编码 + 打分；
+    # model_name 决定按文档缓存的 key，复用 --cache-dir 时不同模型的向量不会混用
+    searcher = searcher_cls(
+        model, cache_dir=cache_dir, model_name=model_name, query_cache_size=0, result_cache_size=0, **kwargs
+    )
+
+    start = time.perf_counter()
+    searcher.build_index(corpus)
+    build_s = time.perf_counter() - start
+    # 第二次 build 命中磁盘缓存：即服务重启时的加载时间
+    start = time.perf_counter()
+    searcher.build_index(corpus)
+    reload_s = time.perf_counter() - start
+
+    qids = list(queries)
+    latencies = []
+    results = {}
+    for qid in qids:
+        start = time.perf_counter()
+        results.update(searcher.search_index({qid: queries[qid]}, top_k))
+        latencies.append(time.perf_counter() - start)
+
+    qps = {}
+    for batch_size in batch_sizes:
+        start = time.perf_counter()
+        for offset in range(0, len(qids), batch_size):
+            searcher.search_index({qid: queries[qid] for qid in qids[offset:offset + batch_size]}, top_k)
+        qps[str(batch_size)] = len(qids) / (time.perf_counter() - start)
+
+    report = {
+        "engine": name,
+        "search_type": search_type,
+        "params": kwargs,
+        "build_s": build_s,
+        "reload_s": reload_s,
+        "latency": percentiles(latencies),
+        "qps": qps,
+        # 进程级峰值：按 ENGINES 顺序单调不减，需要单独数值时一次只跑一个 engine
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    if reference is not None:
+        report[f"recall@{top_k}"] = recall_at_k(results, reference, top_k)
+    logger.info(f"{name}: {report}")
+    return report, results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--engines", nargs="+", default=["exact", "float16", "int8", "ivf"], choices=list(ENGINES))
+    parser.add_argument("--docs", type=int, default=50000, help="synthetic corpus size")
+    parser.add_argument("--dim", type=int, default=384, help="synthetic embedding dimension")
+    parser.add_argument("--queries-count", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 8, 32])
+    parser.add_argument("--corpus", help="real corpus.csv (uses the sentence-transformers model)")
+    parser.add_argument("--queries", help="one query per line, for --corpus")
+    parser.add_argument("--model", default="jxm/cde-small-v2")
+    parser.add_argument("--ratio", type=float, default=1.0)
+    parser.add_argument("--cache-dir", help="embedding cache directory (default: a fresh temp dir)")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s", stream=sys.stderr)
+    torch.manual_seed(args.seed)
+
+    if args.corpus:
+        model, corpus, queries = real_dataset(args.corpus, args.queries, args.model, args.queries_count, args.ratio)
+        dataset = {"corpus": args.corpus, "model": args.model}
+        model_name = args.model
+    else:
+        model, corpus, queries = synthetic_dataset(args.docs, args.queries_count, args.dim, seed=args.seed)
+        dataset = {"synthetic": True, "dim": args.dim, "seed": args.seed}
+        # stub 的向量由 dim 和 seed 决定
+        model_name = f"stub-{args.dim}-{args.seed}"
+    dataset.update({"docs": len(corpus), "queries": len(queries)})
+
+    # 缓存目录默认用临时目录，build_s 总是冷启动的编码 + 建索引时间
+    cache_dir = args.cache_dir or tempfile.mkdtemp(prefix="retriever_bench_")
+    engines = ["exact"] + [name for name in args.engines if name != "exact"]
+    reports = []
+    reference = None
+    try:
+        for name in engines:
+            report, results = bench_engine(
+                name, model, model_name, corpus, queries, args.top_k, args.batch_sizes,
+                os.path.join(cache_dir, name), reference=reference,
+            )
+            if reference is None:
+                reference = results
+            reports.append(report)
+    finally:
+        if not args.cache_dir:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
+    output = {
+        "dataset": dataset,
+        "top_k": args.top_k,
+        "torch": torch.__version__,
+        "threads": torch.get_num_threads(),
+        "platform": platform.platform(),
+        "engines": reports,
+    }
+    text = json.dumps(output, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print(f"✅ Benchmark report written to {args.output}")
+    else:
+        print(text)
+    return output
+
+
+if __name__ == "__main__":
+    main()
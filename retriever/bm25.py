@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+from array import array
+from collections import Counter
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list[str]:
+    return TOKEN_RE.findall(text.lower())
+
+
+class BM25Index:
+    """
+    In-memory BM25 inverted index with array-backed (CSR) postings.
+
+    Term t's postings are doc_idx[offsets[t]:offsets[t + 1]] / tf[...] where doc_idx are row
+    positions in the order the documents were indexed. Saved as one .npy per array plus
+    vocab.json, and loaded with mmap_mode="r".
+    """
+
+    ARRAYS = ("offsets", "doc_idx", "tf", "doc_len", "idf")
+
+    def __init__(self, vocab: dict[str, int], offsets, doc_idx, tf, doc_len, idf, k1: float = 1.5, b: float = 0.75):
+        self.vocab = vocab
+        self.offsets = offsets
+        self.doc_idx = doc_idx
+        self.tf = tf
+        self.doc_len = doc_len
+        self.idf = idf
+        self.k1 = k1
+        self.b = b
+        self.avgdl = float(doc_len.mean()) if len(doc_len) else 0.0
+        # 每个文档的长度归一化项只算一次
+        self._norm = (k1 * (1 - b + b * doc_len / max(self.avgdl, 1e-9))).astype(np.float32)
+
+    def __len__(self) -> int:
+        return len(self.doc_len)
+
+    @classmethod
+    def build(cls, docs, k1: float = 1.5, b: float = 0.75) -> "BM25Index":
+        """docs: iterable of {"title", "text"} in row order."""
+        vocab: dict[str, int] = {}
+        term_ids, doc_ids, tfs = array("i"), array("i"), array("i")
+        doc_len = array("i")
+        for row, doc in enumerate(docs):
+            counts = Counter(tokenize((doc.get("title") or "") + " " + (doc.get("text") or "")))
+            doc_len.append(sum(counts.values()))
+            for term, count in counts.items():
+                term_ids.append(vocab.setdefault(term, len(vocab)))
+                doc_ids.append(row)
+                tfs.append(count)
+
+        term_ids = np.frombuffer(term_ids, dtype=np.int32) if len(term_ids) else np.zeros(0, dtype=np.int32)
+        order = np.argsort(term_ids, kind="stable")
+        offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(term_ids, minlength=len(vocab)))
+
+        n_docs = len(doc_len)
+        df = np.diff(offsets)
+        idf = np.log(1 + (n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+        logger.info(f"Built BM25 index: {n_docs} documents, {len(vocab)} terms, {len(order)} postings.")
+        return cls(
+            vocab,
+            offsets,
+            np.asarray(doc_ids, dtype=np.int32)[order],
+            np.asarray(tfs, dtype=np.float32)[order],
+            np.asarray(doc_len, dtype=np.float32),
+            idf,
+            k1=k1,
+            b=b,
+        )
+
+    def save(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        for name in self.ARRAYS:
+            np.save(os.path.join(path, f"{name}.npy"), getattr(self, name))
+        with open(os.path.join(path, "vocab.json"), "w", encoding="utf-8") as f:
+            json.dump({"k1": self.k1, "b": self.b, "vocab": self.vocab}, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with open(os.path.join(path, "vocab.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in cls.ARRAYS}
+        return cls(meta["vocab"], k1=meta["k1"], b=meta["b"], **arrays)
+
+    def query_terms(self, query: str) -> list[int]:
+        return [self.vocab[t] for t in dict.fromkeys(tokenize(query)) if t in self.vocab]
+
+    def search(self, query: str, top_k: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Scores only the postings of the query terms.
+        :return: (row indices, scores), best first; fewer than top_k if fewer documents match
+        """
+        scores = np.zeros(len(self.doc_len), dtype=np.float32)
+        for term_id in self.query_terms(query):
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            rows = self.doc_idx[start:end]
+            tf = self.tf[start:end]
+            scores[rows] += self.idf[term_id] * tf * (self.k1 + 1) / (tf + self._norm[rows])
+
+        matched = np.flatnonzero(scores)
+        if len(matched) > top_k:
+            matched = matched[np.argpartition(-scores[matched], top_k - 1)[:top_k]]
+        matched = matched[np.argsort(-scores[matched], kind="stable")]
+        return matched, scores[matched]
@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import logging
+import re
+from collections.abc import Mapping
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+WORD_RE = re.compile(r"\S+")
+
+
+def passage_spans(text: str, max_words: int = 200, overlap: int = 50) -> list[tuple[int, int]]:
+    """
+    Splits text into overlapping windows of at most max_words words.
+    :return: list of (start_char, end_char) spans; one (0, len(text)) span for short texts
+    """
+    words = [m.span() for m in WORD_RE.finditer(text)]
+    if len(words) <= max_words:
+        return [(0, len(text))]
+    stride = max(1, max_words - overlap)
+    spans = []
+    for start in range(0, len(words), stride):
+        end = min(start + max_words, len(words))
+        spans.append((words[start][0], words[end - 1][1]))
+        if end == len(words):
+            break
+    return spans
+
+
+class PassageCorpus(Mapping):
+    """
+    {passage_id: {"title", "text"}} view over a document corpus, where every document is cut
+    into overlapping passages. Only (parent doc id, start, end) is stored per passage; the text
+    is sliced from the parent document on lookup.
+    """
+
+    def __init__(self, corpus: Mapping, max_words: int = 200, overlap: int = 50):
+        self.corpus = corpus
+        self.max_words = max_words
+        self.overlap = overlap
+
+        parents, starts, ends = [], [], []
+        for doc_id in corpus:
+            for start, end in passage_spans(corpus[doc_id].get("text") or "", max_words, overlap):
+                parents.append(doc_id)
+                starts.append(start)
+                ends.append(end)
+        self.parents = np.asarray(parents)
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.ends = np.asarray(ends, dtype=np.int64)
+        logger.info(f"Split {len(corpus)} documents into {len(self.parents)} passages.")
+
+    def __len__(self) -> int:
+        return len(self.parents)
+
+    def __iter__(self):
+        return iter(range(len(self.parents)))
+
+    def __contains__(self, passage_id) -> bool:
+        return isinstance(passage_id, (int, np.integer)) and 0 <= passage_id < len(self.parents)
+
+    def __getitem__(self, passage_id) -> dict[str, str]:
+        if passage_id not in self:
+            raise KeyError(passage_id)
+        doc = self.corpus[self.parent(passage_id)]
+        text = doc.get("text") or ""
+        return {
+            "title": doc.get("title") or "",
+            "text": text[self.starts[passage_id]:self.ends[passage_id]],
+        }
+
+    def parent(self, passage_id):
+        doc_id = self.parents[passage_id]
+        return doc_id.item() if isinstance(doc_id, np.generic) else doc_id
+
+    def aggregate(self, passage_scores: dict, top_k: int, agg: str = "max") -> list[tuple]:
+        """
+        Folds passage scores back onto their documents.
+        agg="max" keeps each document's best passage score, agg="sum" adds them up.
+        :return: [(doc_id, score, best_passage_id)] for the top_k documents, best first
+        """
+        if agg not in ("max", "sum"):
+            raise ValueError(f"agg: {agg} must be either (max) or (sum)")
+        doc_scores: dict = {}
+        best_passage: dict = {}
+        for passage_id, score in passage_scores.items():
+            doc_id = self.parent(passage_id)
+            if doc_id not in doc_scores:
+                doc_scores[doc_id] = score
+                best_passage[doc_id] = passage_id
+                continue
+            if score > passage_scores[best_passage[doc_id]]:
+                best_passage[doc_id] = passage_id
+            doc_scores[doc_id] = max(doc_scores[doc_id], score) if agg == "max" else doc_scores[doc_id] + score
+
+        ranked = sorted(doc_scores.items(), key=lambda x: x[1], reverse=True)[:top_k]
+        return [(doc_id, score, best_passage[doc_id]) for doc_id, score in ranked]
@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import logging
+from collections.abc import Mapping, Sequence
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:  # pyarrow 只在使用 Arrow 格式 corpus 时需要
+    pa = None
+    pc = None
+
+logger = logging.getLogger(__name__)
+
+CORPUS_SCHEMA_FIELDS = (("id", "int64"), ("title", "string"), ("text", "string"))
+
+
+def corpus_schema():
+    return pa.schema([(name, getattr(pa, dtype)()) for name, dtype in CORPUS_SCHEMA_FIELDS])
+
+
+class ArrowCorpus(Mapping):
+    """
+    Read-only {id: {"title", "text"}} mapping over a memory-mapped Arrow IPC corpus file
+    (written by data_process.py). Titles and texts stay in the Arrow buffers and are only
+    turned into Python strings when a document is looked up.
+    """
+
+    def __init__(self, path: str, limit: int | None = None):
+        if pa is None:
+            raise ImportError("pyarrow is required to load an Arrow corpus: pip install pyarrow")
+        self.path = path
+        source = pa.memory_map(path, "r")
+        table = pa.ipc.open_file(source).read_all()
+        if limit is not None:
+            table = table.slice(0, limit)
+        self.table = table
+        self._ids = table.column("id").to_numpy()
+        self._titles = table.column("title")
+        self._texts = table.column("text")
+
+        # data_process 写出的 id 与行号一致；否则退回到 id -> row 的映射
+        self._rows = None
+        if not np.array_equal(self._ids, np.arange(len(self._ids))):
+            logger.warning(f"{path}: ids are not row numbers, building id -> row map")
+            self._rows = {int(doc_id): row for row, doc_id in enumerate(self._ids)}
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __iter__(self):
+        return (int(doc_id) for doc_id in self._ids)
+
+    def __contains__(self, doc_id) -> bool:
+        try:
+            self._row(doc_id)
+            return True
+        except (KeyError, TypeError, ValueError):
+            return False
+
+    def _row(self, doc_id) -> int:
+        if self._rows is not None:
+            return self._rows[int(doc_id)]
+        row = int(doc_id)
+        if not 0 <= row < len(self._ids):
+            raise KeyError(doc_id)
+        return row
+
+    def __getitem__(self, doc_id) -> dict[str, str]:
+        row = self._row(doc_id)
+        return {
+            "title": self._titles[row].as_py() or "",
+            "text": self._texts[row].as_py() or "",
+        }
+
+    def ids_by_length(self) -> list:
+        """Document ids sorted by len(title) + len(text), longest first, computed in Arrow."""
+        lengths = (
+            pc.fill_null(pc.utf8_length(self._titles), 0).to_numpy()
+            + pc.fill_null(pc.utf8_length(self._texts), 0).to_numpy()
+        )
+        order = np.argsort(-lengths, kind="stable")
+        return self._ids[order].tolist()
+
+
+class CorpusView(Sequence):
+    """Lazy, ordered list of documents: corpus[ids[i]] is only fetched when accessed."""
+
+    def __init__(self, corpus: Mapping, ids: list):
+        self.corpus = corpus
+        self.ids = ids
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.corpus[doc_id] for doc_id in self.ids[i]]
+        return self.corpus[self.ids[i]]
+
+    def __iter__(self):
+        return (self.corpus[doc_id] for doc_id in self.ids)
@@ -1,8 +1,14 @@
 import pandas as pd
-import numpy as np
 import os
 import json
 import glob
+import hashlib
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "web_scraper", "src", "clawer")))
+from retriever.corpus_store import corpus_schema, pa
+from shards import ShardReader
 
 
 
@@ -10,137 +16,315 @@ import glob
 Attribute names for the job data
 URL ID,JobTitle,detailText,viewJobQualificationItem,viewJobBenefitItem,viewJobBodyJobFullDescriptionContent,original URL
 
-Attribute names for wiki data 
+Attribute names for wiki data
 title, paragraph
 
-Corpus : 
+Corpus :
 Common attribute names : title(for job, JobTitie is title), text(for job, it concats attributes except URL ID. For wiki, it concats paragraph)
 
+Pipeline (streaming, incremental):
+    every group*.csv  -> parts/job/<name>.csv          (title, text), rebuilt only if the input changed
+    wiki *.json       -> parts/wiki/json-<bucket>.csv  hashed by file name into WIKI_JSON_BUCKETS buckets;
+                                                       a bucket is rebuilt only if one of its files changed
+    each wiki shard   -> parts/wiki/shard-<name>.csv   latest record per page, streamed via the shard index;
+                                                       rebuilt only if the shard or its live entries changed
+    parts             -> corpus.csv                    (id, title, text), appended chunk by chunk
+                      -> corpus.arrow                  same rows as an Arrow IPC file (if pyarrow is installed)
+Input signatures (mtime, size, sha1) are kept in manifest.json.
 """
 data_base_path = './web_scraper/data/'
 data_target_path = './Retriever/data/'
 job_folder = os.path.join(data_base_path, 'job')
-
-merged_job_path = os.path.join(data_target_path, 'job_merged.csv')
-
-# 检查是否已存在 job_merged.csv
-if not os.path.exists(merged_job_path):
-    # 查找所有 group*.csv 文件
-    job_files = glob.glob(os.path.join(job_folder, 'group*.csv'))
-
-    # 合并所有文件
-    job_dfs = [pd.read_csv(f) for f in job_files]
-    job_merged = pd.concat(job_dfs, ignore_index=True)
-    job_merged = job_merged[job_merged["JobTitle"].notnull()]
-    job_merged = job_merged.fillna("")
-
-    none_in_columns = job_merged.isnull().any()
-    if none_in_columns.any():
-        print("⚠️ 合并后的数据中存在 None 值:")
-        for col, has_none in none_in_columns.items():
-            if has_none:
-                none_ratio = job_merged[col].isnull().mean() * 100  # 计算缺失值占比
-                print(f" - 列 '{col}' 中存在 None 值，占比: {none_ratio:.2f}%")
-    else:
-        print("✅ 合并后的数据中不存在 None 值")
-
-    # 保存为 job_merged.csv
-    job_merged.to_csv(merged_job_path, index=False)
-    print(f"✅ 合并 {len(job_files)} 个 job 文件为 job_merged.csv，包含 {len(job_merged)} 条记录。")
-else:
-    print(f"✅ 文件 {merged_job_path} 已存在，跳过合并。")
-
-
 wiki_folder = os.path.join(data_base_path, 'wiki')
-merged_wiki_path = os.path.join(data_target_path, 'wiki_merged.csv')
-
-# 检查是否已存在 wiki_merged.csv
-if not os.path.exists(merged_wiki_path):
-    wiki_files = glob.glob(os.path.join(wiki_folder, '*.json'))
 
-    wiki_data = []
-
-    for path in wiki_files:
-        with open(path, 'r', encoding='utf-8') as f:
-            content = json.load(f)
-
-            # 假设结构是 {"data": {"title": ..., "paragraphs": [...]}}
-            if "data" in content:
-                title = content["data"].get("title", "")
-                paragraphs = content["data"].get("paragraphs", [])
-                text = "\n\n".join(paragraphs) if isinstance(paragraphs, list) else str(paragraphs)
-                wiki_data.append({
-                    "title": title,
-                    "text": text
-                })
-
-    # 转换为 DataFrame 并保存
-    wiki_df = pd.DataFrame(wiki_data)
-    none_in_columns = wiki_df.isnull().any()
-    if none_in_columns.any():
-        print("⚠️ 合并后的数据中存在 None 值:")
-        for col, has_none in none_in_columns.items():
-            if has_none:
-                print(f" - 列 '{col}' 中存在 None 值")
-    else:
-        print("✅ 合并后的数据中不存在 None 值")
-
-    wiki_df.to_csv(merged_wiki_path, index=False)
-    print(f"✅ 合并 {len(wiki_files)} 个 wiki 文件为 wiki_merged.csv，包含 {len(wiki_df)} 条记录。")
-else:
-    print(f"✅ 文件 {merged_wiki_path} 已存在，跳过合并。")
-
-# === 加载 job 和 wiki 合并文件 ===
-job_df = pd.read_csv(merged_job_path)
-wiki_df = pd.read_csv(merged_wiki_path)
+parts_path = os.path.join(data_target_path, 'parts')
+manifest_path = os.path.join(data_target_path, 'manifest.json')
+corpus_path = os.path.join(data_target_path, 'corpus.csv')
+corpus_arrow_path = os.path.join(data_target_path, 'corpus.arrow')
 
-# === 处理 job 数据：添加 title / text / label 字段 ===
-job_df["title"] = job_df["JobTitle"]
-job_df["text"] = job_df[[
+JOB_TEXT_COLUMNS = [
     "detailText",
     "viewJobQualificationItem",
     "viewJobBenefitItem",
     "viewJobBodyJobFullDescriptionContent",
     "original URL"
-]].fillna("").agg("\n\n".join, axis=1)
+]
+CHUNK_SIZE = 10000
+WIKI_JSON_BUCKETS = 64
 
-job_df = job_df[["title", "text"]]
 
+def file_hash(path):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
 
-# === 处理 wiki 数据：保持 title，用 text 字段替代 paragraph ===
 
+def file_signature(path, old=None):
+    """mtime/size of path; the sha1 is only recomputed when mtime or size moved."""
+    st = os.stat(path)
+    signature = {"mtime": st.st_mtime, "size": st.st_size}
+    if old and old.get("mtime") == st.st_mtime and old.get("size") == st.st_size:
+        signature["sha1"] = old.get("sha1")
+    else:
+        signature["sha1"] = file_hash(path)
+    return signature
+
+
+def is_unchanged(old, new):
+    return old is not None and old.get("sha1") == new["sha1"]
+
+
+def load_manifest():
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {"job": {}, "wiki": {"json": {}, "shards": {}}}
+
+
+def save_manifest(manifest):
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, manifest_path)
+
+
+def join_columns(df, columns, sep="\n\n"):
+    # 向量化字符串拼接，替代逐行的 agg("\n\n".join, axis=1)
+    text = df[columns[0]].fillna("").astype(str)
+    for col in columns[1:]:
+        text = text + sep + df[col].fillna("").astype(str)
+    return text
+
+
+def append_csv(df, path, first):
+    df.to_csv(path, mode='w' if first else 'a', header=first, index=False)
+
+
+def build_job_part(src, dst):
+    """Streams one group*.csv into a (title, text) part file."""
+    tmp_path = dst + '.tmp'
+    n_rows = 0
+    first = True
+    for chunk in pd.read_csv(src, chunksize=CHUNK_SIZE, dtype=str):
+        chunk = chunk[chunk["JobTitle"].notnull()]
+        for col in JOB_TEXT_COLUMNS:
+            if col not in chunk.columns:
+                chunk[col] = ""
+        part = pd.DataFrame({
+            "title": chunk["JobTitle"].astype(str),
+            "text": join_columns(chunk, JOB_TEXT_COLUMNS),
+        })
+        append_csv(part, tmp_path, first)
+        first = False
+        n_rows += len(part)
+    if first:
+        append_csv(pd.DataFrame(columns=["title", "text"]), tmp_path, True)
+    os.replace(tmp_path, dst)
+    return n_rows
+
+
+def wiki_row(content):
+    # 假设结构是 {"data": {"title": ..., "paragraphs": [...]}}
+    if "data" in content:
+        title = content["data"].get("title", "")
+        paragraphs = content["data"].get("paragraphs", [])
+        text = "\n\n".join(paragraphs) if isinstance(paragraphs, list) else str(paragraphs)
+        return {"title": title, "text": text}
+    return None
+
+
+def iter_json_files(paths):
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            yield json.load(f)
+
+
+def iter_wiki_rows(contents):
+    """Rows of wiki records, e.g. iter_json_files(...) or ShardReader.iter_records(...)."""
+    for content in contents:
+        row = wiki_row(content)
+        if row is not None:
+            yield row
+
+
+def build_wiki_part(contents, dst):
+    """Streams wiki records into a (title, text) part file, CHUNK_SIZE rows at a time."""
+    tmp_path = dst + '.tmp'
+    n_rows = 0
+    first = True
+    buffer = []
+    for row in iter_wiki_rows(contents):
+        buffer.append(row)
+        if len(buffer) >= CHUNK_SIZE:
+            append_csv(pd.DataFrame(buffer, columns=["title", "text"]), tmp_path, first)
+            first = False
+            n_rows += len(buffer)
+            buffer = []
+    if buffer or first:
+        append_csv(pd.DataFrame(buffer, columns=["title", "text"]), tmp_path, first)
+        n_rows += len(buffer)
+    os.replace(tmp_path, dst)
+    return n_rows
+
+
+def update_job_parts(manifest):
+    job_parts_path = os.path.join(parts_path, 'job')
+    os.makedirs(job_parts_path, exist_ok=True)
+
+    job_files = sorted(glob.glob(os.path.join(job_folder, 'group*.csv')))
+    seen = set()
+    rebuilt = 0
+    for src in job_files:
+        name = os.path.basename(src)
+        dst = os.path.join(job_parts_path, name)
+        seen.add(name)
+        signature = file_signature(src, manifest["job"].get(name))
+        if is_unchanged(manifest["job"].get(name), signature) and os.path.exists(dst):
+            continue
+        n_rows = build_job_part(src, dst)
+        manifest["job"][name] = signature
+        rebuilt += 1
+        print(f"✅ {name}: {n_rows} 条记录")
+
+    # 删除已不存在的输入对应的 part
+    for name in list(manifest["job"]):
+        if name not in seen:
+            del manifest["job"][name]
+            part = os.path.join(job_parts_path, name)
+            if os.path.exists(part):
+                os.remove(part)
+            rebuilt += 1
+
+    print(f"✅ job 文件共 {len(job_files)} 个，新增/修改/删除 {rebuilt} 个，其余未变化跳过。")
+    return [os.path.join(job_parts_path, os.path.basename(f)) for f in job_files], rebuilt > 0
+
+
+def json_bucket(name):
+    return int(hashlib.md5(name.encode('utf-8')).hexdigest(), 16) % WIKI_JSON_BUCKETS
+
+
+def remove_stale_parts(directory, keep):
+    removed = 0
+    for path in glob.glob(os.path.join(directory, '*.csv')):
+        if os.path.basename(path) not in keep:
+            os.remove(path)
+            removed += 1
+    return removed
+
+
+def update_wiki_parts(manifest):
+    wiki_parts_path = os.path.join(parts_path, 'wiki')
+    os.makedirs(wiki_parts_path, exist_ok=True)
+    old_part = os.path.join(parts_path, 'wiki.csv')
+    if os.path.exists(old_part):
+        # 旧版本的单一 wiki part
+        os.remove(old_part)
+    wiki = manifest["wiki"]
+    if set(wiki) != {"json", "shards"}:
+        wiki = manifest["wiki"] = {"json": {}, "shards": {}}
+    rebuilt = 0
+
+    # 按文件名 hash 分桶：一个 json 变化只重建它所在的桶
+    buckets = {}
+    for path in sorted(glob.glob(os.path.join(wiki_folder, '*.json'))):
+        buckets.setdefault(f'json-{json_bucket(os.path.basename(path)):02d}.csv', []).append(path)
+    for part_name, paths in sorted(buckets.items()):
+        old = wiki["json"].get(part_name, {})
+        signatures = {os.path.basename(p): file_signature(p, old.get(os.path.basename(p))) for p in paths}
+        dst = os.path.join(wiki_parts_path, part_name)
+        if set(old) == set(signatures) and all(is_unchanged(old[k], v) for k, v in signatures.items()) and os.path.exists(dst):
+            continue
+        build_wiki_part(iter_json_files(paths), dst)
+        wiki["json"][part_name] = signatures
+        rebuilt += 1
+
+    # 每个 shard 一个 part；签名包括 shard 文件和索引中它的有效记录（被后续写入覆盖或删除的记录会改变它）
+    shard_reader = ShardReader(wiki_folder)
+    shard_parts = {}
+    for shard, entries in shard_reader.entries_by_shard().items():
+        part_name = f'shard-{shard}.csv'
+        live = hashlib.sha1(json.dumps([(e['key'], e['offset'], e['length']) for e in entries]).encode('utf-8')).hexdigest()
+        old = wiki["shards"].get(part_name)
+        signature = file_signature(os.path.join(wiki_folder, shard), old)
+        signature["live"] = live
+        dst = os.path.join(wiki_parts_path, part_name)
+        shard_parts[part_name] = dst
+        if is_unchanged(old, signature) and old.get("live") == live and os.path.exists(dst):
+            continue
+        build_wiki_part(shard_reader.iter_records(entries=entries), dst)
+        wiki["shards"][part_name] = signature
+        rebuilt += 1
+
+    # 删除已不存在的输入对应的 part
+    for kind, keep in (("json", buckets), ("shards", shard_parts)):
+        for part_name in list(wiki[kind]):
+            if part_name not in keep:
+                del wiki[kind][part_name]
+    rebuilt += remove_stale_parts(wiki_parts_path, set(buckets) | set(shard_parts))
+
+    n_files = sum(len(paths) for paths in buckets.values())
+    print(f"✅ wiki 文件共 {n_files} 个、shard 共 {len(shard_parts)} 个，重建/删除 {rebuilt} 个 part，其余未变化跳过。")
+    part_files = [os.path.join(wiki_parts_path, name) for name in sorted(buckets)] + list(shard_parts.values())
+    return part_files, rebuilt > 0
+
+
+def assemble_corpus(part_files, path, arrow_path=None):
+    """
+    Concatenates part files into corpus.csv chunk by chunk, assigning sequential ids.
+    If arrow_path is given (and pyarrow is installed) the same rows are also written as an
+    Arrow IPC file that the retriever memory-maps instead of parsing the CSV.
+    """
+    tmp_path = path + '.tmp'
+    arrow_writer = None
+    if arrow_path is not None:
+        arrow_tmp_path = arrow_path + '.tmp'
+        arrow_writer = pa.ipc.new_file(arrow_tmp_path, corpus_schema())
+
+    next_id = 0
+    first = True
+    for part in part_files:
+        for chunk in pd.read_csv(part, chunksize=CHUNK_SIZE, keep_default_na=False, dtype=str):
+            chunk = chunk[(chunk["title"] != "") & (chunk["text"] != "")]
+            chunk.insert(0, "id", range(next_id, next_id + len(chunk)))
+            next_id += len(chunk)
+            append_csv(chunk, tmp_path, first)
+            if arrow_writer is not None:
+                arrow_writer.write_table(pa.Table.from_pandas(chunk, schema=corpus_schema(), preserve_index=False))
+            first = False
+    if first:
+        append_csv(pd.DataFrame(columns=["id", "title", "text"]), tmp_path, True)
+    os.replace(tmp_path, path)
+    if arrow_writer is not None:
+        arrow_writer.close()
+        os.replace(arrow_tmp_path, arrow_path)
+    return next_id
+
+
+def main():
+    os.makedirs(parts_path, exist_ok=True)
+    manifest = load_manifest()
+
+    job_parts, job_changed = update_job_parts(manifest)
+    wiki_parts, wiki_changed = update_wiki_parts(manifest)
+
+    arrow_path = corpus_arrow_path if pa is not None else None
+    if pa is None:
+        print("⚠️ 未安装 pyarrow，跳过生成 corpus.arrow")
+    outputs_missing = not os.path.exists(corpus_path) or (arrow_path is not None and not os.path.exists(arrow_path))
+
+    if job_changed or wiki_changed or outputs_missing:
+        if arrow_path is None and os.path.exists(corpus_arrow_path):
+            # 不重写 corpus.arrow 时删掉旧的，否则检索端会继续读旧 corpus
+            os.remove(corpus_arrow_path)
+            print(f"⚠️ 已删除过期的 {corpus_arrow_path}")
+        n_docs = assemble_corpus(job_parts + wiki_parts, corpus_path, arrow_path)
+        print(f"✅ 已生成最终 corpus.csv，共 {n_docs} 条数据，保存至：{corpus_path}")
+    else:
+        print(f"✅ 输入未变化，跳过生成 {corpus_path}")
+    save_manifest(manifest)
 
-# # 补齐 wiki 缺少的 job 字段
-# for col in job_df.columns:
-#     if col not in wiki_df.columns:
-#         wiki_df[col] = ""
-
-# # 补齐 job 缺少的 wiki 字段（理论上只有 label、title、text 已够）
-# for col in wiki_df.columns:
-#     if col not in job_df.columns:
-#         job_df[col] = ""
-
-# 合并两类数据
-job_df = job_df[["title", "text"]].reset_index(drop=True)
-wiki_df = wiki_df[["title", "text"]].reset_index(drop=True)
-
-
-corpus_df = pd.concat([job_df, wiki_df], ignore_index=True)
-corpus_df = corpus_df.reset_index().rename(columns={"index": "id"})
-
-corpus_df = corpus_df.dropna(subset=["title", "text"]).reset_index(drop=True)
-
-
-none_in_columns = corpus_df.isnull().any()
-if none_in_columns.any():
-    print("⚠️ 合并后的数据中存在 None 值:")
-    for col, has_none in none_in_columns.items():
-        if has_none:
-            none_ratio = corpus_df[col].isnull().mean() * 100  # 计算缺失值占比
-            print(f" - 列 '{col}' 中存在 None 值，占比: {none_ratio:.8f}%")
-
-# 保存最终结果
-corpus_path = os.path.join(data_target_path, 'corpus.csv')
-corpus_df.to_csv(corpus_path, index=False)
 
-print(f"✅ 已生成最终 corpus.csv，共 {len(corpus_df)} 条数据，保存至：{corpus_path}")
+if __name__ == "__main__":
+    main()
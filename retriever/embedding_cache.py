@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import time
+
+import numpy as np
+import torch
+
+logger = logging.getLogger(__name__)
+
+
+def document_key(model_name: str, doc: dict[str, str]) -> str:
+    """Content address of one document for one model: sha1(model \\0 title \\0 text)."""
+    h = hashlib.sha1()
+    h.update(model_name.encode("utf-8"))
+    h.update(b"\0")
+    h.update((doc.get("title") or "").encode("utf-8"))
+    h.update(b"\0")
+    h.update((doc.get("text") or "").encode("utf-8"))
+    return h.hexdigest()
+
+
+def corpus_key(doc_keys: list[str]) -> str:
+    """Hash of an ordered list of document keys, used to name the assembled corpus store."""
+    return hashlib.md5("".join(doc_keys).encode("ascii")).hexdigest()
+
+
+class DocumentEmbeddingCache:
+    """
+    Content-addressed, per-document embedding cache.
+
+    Files under cache_dir:
+        dim             embedding dimension
+        generation      current generation g (missing: 0)
+        keys[.g].txt    one document key per line, line i <-> row i
+        vectors[.g].f32 append-only float32 rows (dim fixed by the first write)
+
+    Rows are appended before their keys, so an interrupted write leaves at most some
+    unreferenced trailing rows, which are ignored on load. compact() writes the next
+    generation's pair of files and then switches to it with a single rename of the
+    generation file, so keys and vectors are always read from the same generation.
+    """
+
+    def __init__(self, cache_dir: str, compact_ratio: float = 0.5):
+        self.cache_dir = cache_dir
+        self.dim_path = os.path.join(cache_dir, "dim")
+        self.generation_path = os.path.join(cache_dir, "generation")
+        self.compact_ratio = compact_ratio
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load()
+
+    def _paths(self, generation: int) -> tuple[str, str]:
+        """(keys_path, vectors_path) of a generation; generation 0 keeps the original file names."""
+        suffix = f".{generation}" if generation else ""
+        return (
+            os.path.join(self.cache_dir, f"keys{suffix}.txt"),
+            os.path.join(self.cache_dir, f"vectors{suffix}.f32"),
+        )
+
+    def _remove_other_generations(self):
+        # 上次 compact 在切换前后被打断时留下的文件
+        current = {os.path.basename(self.keys_path), os.path.basename(self.vectors_path)}
+        for name in os.listdir(self.cache_dir):
+            if name not in current and (
+                (name.startswith("keys") and name.endswith(".txt"))
+                or (name.startswith("vectors") and name.endswith(".f32"))
+            ):
+                os.remove(os.path.join(self.cache_dir, name))
+
+    def _load(self):
+        self.rows: dict[str, int] = {}
+        self._n_rows = 0
+        self.dim = None
+        self.generation = 0
+        if os.path.exists(self.generation_path):
+            with open(self.generation_path, "r") as f:
+                self.generation = int(f.read())
+        self.keys_path, self.vectors_path = self._paths(self.generation)
+        self._remove_other_generations()
+        if not os.path.exists(self.dim_path):
+            return
+        with open(self.dim_path, "r") as f:
+            self.dim = int(f.read())
+
+        keys = []
+        if os.path.exists(self.keys_path):
+            with open(self.keys_path, "r", encoding="ascii") as f:
+                keys = f.read().split()
+        n_rows = os.path.getsize(self.vectors_path) // (4 * self.dim) if os.path.exists(self.vectors_path) else 0
+        keys = keys[:n_rows]
+        self.rows = {key: row for row, key in enumerate(keys)}
+        self._n_rows = len(keys)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.rows
+
+    def _vectors(self) -> np.ndarray:
+        return np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(self._n_rows, self.dim))
+
+    def add(self, keys: list[str], embeddings: torch.Tensor):
+        if not keys:
+            return
+        array = embeddings.detach().cpu().float().numpy() if isinstance(embeddings, torch.Tensor) else np.asarray(embeddings, dtype=np.float32)
+        if self.dim is None:
+            self.dim = array.shape[1]
+            # 新建缓存：清掉没有 dim 记录时遗留的文件
+            open(self.vectors_path, "wb").close()
+            open(self.keys_path, "w").close()
+            with open(self.dim_path, "w") as f:
+                f.write(str(self.dim))
+
+        with open(self.vectors_path, "r+b") as f:
+            f.seek(self._n_rows * self.dim * 4)
+            np.ascontiguousarray(array, dtype=np.float32).tofile(f)
+            f.truncate()
+        with open(self.keys_path, "a", encoding="ascii") as f:
+            f.write("\n".join(keys) + "\n")
+
+        for i, key in enumerate(keys):
+            self.rows[key] = self._n_rows + i
+        self._n_rows += len(keys)
+
+    def add_missing(self, keys: list[str], embeddings: torch.Tensor):
+        """Adds the rows of embeddings whose key is not cached yet (e.g. when importing an old cache)."""
+        rows, new_keys, seen = [], [], set()
+        for row, key in enumerate(keys):
+            if key not in self.rows and key not in seen:
+                rows.append(row)
+                new_keys.append(key)
+                seen.add(key)
+        if rows:
+            self.add(new_keys, embeddings[rows])
+
+    def get(self, keys: list[str]) -> torch.Tensor:
+        """Stacks cached rows for keys (all must be present) into a float32 tensor."""
+        if not keys:
+            return torch.zeros((0, self.dim or 0), dtype=torch.float32)
+        rows = np.fromiter((self.rows[key] for key in keys), dtype=np.int64, count=len(keys))
+        return torch.from_numpy(np.ascontiguousarray(self._vectors()[rows]))
+
+    def compact(self, live_keys: set[str]):
+        """Rewrites the cache keeping only live_keys, dropping rows of deleted documents."""
+        keep = [key for key in self.rows if key in live_keys]
+        if len(keep) == len(self.rows):
+            return
+        vectors = self.get(keep).numpy() if keep else np.zeros((0, self.dim), dtype=np.float32)
+
+        generation = self.generation + 1
+        keys_path, vectors_path = self._paths(generation)
+        vectors.tofile(vectors_path)
+        with open(keys_path, "w", encoding="ascii") as f:
+            f.write("".join(key + "\n" for key in keep))
+        # 只有这一次 rename 切换代际：中途崩溃时要么仍是旧的一对文件，要么是新的一对
+        tmp_generation = self.generation_path + ".tmp"
+        with open(tmp_generation, "w") as f:
+            f.write(str(generation))
+        os.replace(tmp_generation, self.generation_path)
+        self.generation, self.keys_path, self.vectors_path = generation, keys_path, vectors_path
+        self._remove_other_generations()
+
+        logger.info(f"Compacted document embedding cache: {len(self.rows)} -> {len(keep)} rows.")
+        self.rows = {key: row for row, key in enumerate(keep)}
+        self._n_rows = len(keep)
+
+    def get_or_encode(self, keys: list[str], docs: list[dict[str, str]], encode_chunks, chunk_size: int = 4096) -> torch.Tensor:
+        """
+        Returns embeddings for docs in order, encoding only documents whose key is not cached yet.
+
+        Missing documents are split into chunks of chunk_size; encode_chunks takes the list of chunks
+        and yields one (len(chunk), dim) tensor per chunk, in order. Every chunk is appended to the
+        cache as soon as it arrives, so an interrupted build resumes where it stopped.
+        Rows of documents no longer present are dropped once they exceed compact_ratio of the cache.
+        """
+        missing = {}
+        for key, doc in zip(keys, docs):
+            if key not in self.rows and key not in missing:
+                missing[key] = doc
+
+        logger.info(f"Document embedding cache: {len(keys) - len(missing)} cached, {len(missing)} to encode.")
+        if missing:
+            missing_keys = list(missing)
+            missing_docs = list(missing.values())
+            key_chunks = [missing_keys[i:i + chunk_size] for i in range(0, len(missing_keys), chunk_size)]
+            doc_chunks = [missing_docs[i:i + chunk_size] for i in range(0, len(missing_docs), chunk_size)]
+
+            start_time = time.perf_counter()
+            n_done = 0
+            for chunk_keys, embeddings in zip(key_chunks, encode_chunks(doc_chunks)):
+                self.add(chunk_keys, embeddings)
+                n_done += len(chunk_keys)
+                elapsed = time.perf_counter() - start_time
+                logger.info(
+                    f"Encoded {n_done}/{len(missing_keys)} documents ({n_done / max(elapsed, 1e-9):.1f} docs/sec)"
+                )
+
+        live_keys = set(keys)
+        stale = len(self.rows) - len(live_keys)
+        if stale > 0 and stale > self.compact_ratio * len(self.rows):
+            self.compact(live_keys)
+        return self.get(keys)
@@ -0,0 +1,165 @@
+"""
+On-disk embedding store
+
+Layout (little endian):
+    [0, 8)             magic b"EMBSTOR1"
+    [8, 12)            uint32 length of the JSON header
+    [12, HEADER_SIZE)  JSON header: {"n", "dim", "dtype", "sections": {name: [offset, nbytes]}}
+    sections           "data"   n x dim in dtype (float32 / float16 / int8)
+                       "norms"  n float32, L2 norm of the original float32 rows
+                       "scales" n float32, per-row int8 scale (int8 only)
+
+Sections are opened with np.memmap, so opening is O(1) and several processes reading the
+same file share the OS page cache.
+"""
+from __future__ import annotations
+
+import json
+import os
+
+import numpy as np
+import torch
+
+from retriever.util import merge_topk
+
+MAGIC = b"EMBSTOR1"
+HEADER_SIZE = 4096
+ALIGN = 64
+DTYPES = {"float32": np.float32, "float16": np.float16, "int8": np.int8}
+
+
+def _align(offset: int) -> int:
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+def quantize(embeddings: np.ndarray, dtype: str):
+    """
+    Converts float32 rows to dtype.
+    :return: (data, scales) where scales is None unless dtype is int8
+    """
+    if dtype not in DTYPES:
+        raise ValueError(f"dtype: {dtype} must be one of {list(DTYPES)}")
+    if dtype != "int8":
+        return embeddings.astype(DTYPES[dtype]), None
+
+    scales = np.abs(embeddings).max(axis=1, initial=0.0) / 127.0
+    scales[scales == 0] = 1.0
+    data = np.clip(np.rint(embeddings / scales[:, None]), -127, 127).astype(np.int8)
+    return data, scales.astype(np.float32)
+
+
+def write_embedding_store(path: str, embeddings, dtype: str = "float32"):
+    """Writes embeddings (tensor or array, n x dim) to path atomically."""
+    if isinstance(embeddings, torch.Tensor):
+        embeddings = embeddings.detach().cpu().float().numpy()
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    if embeddings.size == 0 and embeddings.ndim != 2:
+        # 空 corpus 编码结果可能是一维空数组
+        embeddings = embeddings.reshape(0, 0)
+    n, dim = embeddings.shape
+
+    data, scales = quantize(embeddings, dtype)
+    sections = {"data": data, "norms": np.linalg.norm(embeddings, axis=1).astype(np.float32)}
+    if scales is not None:
+        sections["scales"] = scales
+
+    layout = {}
+    offset = HEADER_SIZE
+    for name, array in sections.items():
+        layout[name] = [offset, array.nbytes]
+        offset = _align(offset + array.nbytes)
+
+    header = json.dumps({"n": n, "dim": dim, "dtype": dtype, "sections": layout}).encode("utf-8")
+    if len(MAGIC) + 4 + len(header) > HEADER_SIZE:
+        raise ValueError("Embedding store header too large")
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(np.uint32(len(header)).tobytes())
+        f.write(header)
+        for name, array in sections.items():
+            f.seek(layout[name][0])
+            array.tofile(f)
+    os.replace(tmp_path, path)
+
+
+class EmbeddingStore:
+    """Read-only, memory-mapped view of a file written by write_embedding_store."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not an embedding store")
+            header_len = int(np.frombuffer(f.read(4), dtype=np.uint32)[0])
+            header = json.loads(f.read(header_len).decode("utf-8"))
+
+        self.n = header["n"]
+        self.dim = header["dim"]
+        self.dtype = header["dtype"]
+        sections = header["sections"]
+
+        # mode "c" (copy-on-write) gives writable arrays for torch.from_numpy without touching the file
+        def _map(name, np_dtype, shape):
+            offset, _ = sections[name]
+            if 0 in shape:
+                # np.memmap 不能映射长度为 0 的区间（空 corpus）
+                return torch.from_numpy(np.empty(shape, dtype=np_dtype))
+            return torch.from_numpy(np.memmap(path, dtype=np_dtype, mode="c", offset=offset, shape=shape))
+
+        self.data = _map("data", DTYPES[self.dtype], (self.n, self.dim))
+        self.norms = _map("norms", np.float32, (self.n,))
+        self.scales = _map("scales", np.float32, (self.n,)) if "scales" in sections else None
+
+    def __len__(self) -> int:
+        return self.n
+
+    @property
+    def nbytes(self) -> int:
+        return os.path.getsize(self.path)
+
+    def block(self, start: int, end: int) -> torch.Tensor:
+        """Dequantized float32 rows [start, end)."""
+        rows = self.data[start:end].float()
+        if self.scales is not None:
+            rows = rows * self.scales[start:end, None]
+        return rows
+
+    def rows(self, idx: torch.Tensor) -> torch.Tensor:
+        """Dequantized float32 rows at the given indices."""
+        rows = self.data[idx].float()
+        if self.scales is not None:
+            rows = rows * self.scales[idx].unsqueeze(-1)
+        return rows
+
+    def to_tensor(self) -> torch.Tensor:
+        return self.block(0, self.n)
+
+    def topk(self, query_embeddings: torch.Tensor, top_k: int, score_function: str, block_size: int = 65536):
+        """
+        Scores queries directly against the stored (possibly quantized) matrix, one block at a time.
+        :return: (values, indices) tensors of shape (|queries|, min(top_k, n)), best first
+        """
+        queries = query_embeddings.float().cpu()
+        if len(queries.shape) == 1:
+            queries = queries.unsqueeze(0)
+        if score_function == "cos_sim":
+            queries = torch.nn.functional.normalize(queries, p=2, dim=1)
+
+        top_k = min(top_k, self.n)
+        if top_k == 0:
+            return torch.empty(len(queries), 0), torch.empty(len(queries), 0, dtype=torch.long)
+        best_values, best_idx = None, None
+        for start in range(0, self.n, block_size):
+            end = min(start + block_size, self.n)
+            scores = torch.mm(queries, self.block(start, end).transpose(0, 1))
+            if score_function == "cos_sim":
+                scores /= self.norms[start:end].clamp_min(1e-12)
+            scores[torch.isnan(scores)] = -1
+
+            values, idx = torch.topk(scores, min(top_k, end - start), dim=1, largest=True, sorted=False)
+            best_values, best_idx = merge_topk(best_values, best_idx, values, idx + start, top_k)
+
+        best_values, order = torch.sort(best_values, dim=1, descending=True)
+        return best_values, torch.gather(best_idx, 1, order)
@@ -1,20 +1,29 @@
 from __future__ import annotations
 
+import contextlib
 import heapq
 import logging
 
 import torch
 
-from retriever.util import cos_sim, dot_score
+from retriever import metrics
+from retriever.corpus_store import CorpusView
+from retriever.embedding_cache import DocumentEmbeddingCache, corpus_key, document_key
+from retriever.embedding_store import EmbeddingStore, write_embedding_store
+from retriever.parallel_encode import ParallelCorpusEncoder
+from retriever.query_cache import LRUCache, normalize_query
+from retriever.util import cos_sim, dot_score, topk_blockwise
 
 logger = logging.getLogger(__name__)
 
 from abc import ABC, abstractmethod
 
+import glob
 import os
 import pickle
 import json
 import hashlib
+import shutil
 
 
 class BaseSearch(ABC):
@@ -33,9 +42,149 @@ def get_corpus_id(corpus: dict[str, dict[str, str]]) -> str:
     serialized = json.dumps({k: corpus[k] for k in sorted(corpus)}, sort_keys=True)
     return hashlib.md5(serialized.encode('utf-8')).hexdigest()
 
+class CorpusIndex:
+    """Resident, build-once view of an encoded corpus.
+
+    Keeps the corpus id mapping, the raw embeddings and the L2-normalized
+    embeddings in memory so queries only pay for encoding and scoring.
+    """
+
+    def __init__(
+        self,
+        corpus_ids: list,
+        embeddings: torch.Tensor,
+        corpus_hash: str | None = None,
+        score_block_size: int | None = None,
+    ):
+        self.corpus_ids = corpus_ids
+        self.embeddings = embeddings
+        self.normalized_embeddings = torch.nn.functional.normalize(embeddings, p=2, dim=1)
+        self.corpus_hash = corpus_hash
+        # None: score the full queries x corpus matrix; otherwise walk the corpus in blocks
+        self.score_block_size = score_block_size
+
+    def __len__(self) -> int:
+        return len(self.corpus_ids)
+
+    def score(self, query_embeddings: torch.Tensor, score_function: str) -> torch.Tensor:
+        if not isinstance(query_embeddings, torch.Tensor):
+            query_embeddings = torch.tensor(query_embeddings)
+        if len(query_embeddings.shape) == 1:
+            query_embeddings = query_embeddings.unsqueeze(0)
+        query_embeddings = query_embeddings.to(self.embeddings.device)
+
+        if score_function == "cos_sim":
+            # corpus side is normalized once at build time
+            query_norm = torch.nn.functional.normalize(query_embeddings, p=2, dim=1)
+            return torch.mm(query_norm, self.normalized_embeddings.transpose(0, 1))
+        return dot_score(query_embeddings, self.embeddings)
+
+    def topk(self, query_embeddings: torch.Tensor, top_k: int, score_function: str, return_sorted: bool = False):
+        if self.score_block_size:
+            return self._topk_blockwise(query_embeddings, top_k, score_function, return_sorted)
+
+        scores = self.score(query_embeddings, score_function)
+        scores[torch.isnan(scores)] = -1
+        values, idx = torch.topk(
+            scores,
+            min(top_k, len(self)),
+            dim=1,
+            largest=True,
+            sorted=return_sorted,
+        )
+        return values.cpu().tolist(), idx.cpu().tolist()
+
+    def _topk_blockwise(self, query_embeddings: torch.Tensor, top_k: int, score_function: str, return_sorted: bool):
+        if not isinstance(query_embeddings, torch.Tensor):
+            query_embeddings = torch.tensor(query_embeddings)
+        query_embeddings = query_embeddings.to(self.embeddings.device)
+
+        if score_function == "cos_sim":
+            query_norm = torch.nn.functional.normalize(query_embeddings, p=2, dim=-1)
+            values, idx = topk_blockwise(
+                query_norm, self.normalized_embeddings, top_k,
+                score_function=dot_score, block_size=self.score_block_size, sorted=return_sorted,
+            )
+        else:
+            values, idx = topk_blockwise(
+                query_embeddings, self.embeddings, top_k,
+                score_function=dot_score, block_size=self.score_block_size, sorted=return_sorted,
+            )
+        return values.cpu().tolist(), idx.cpu().tolist()
+
+
+class MmapCorpusIndex(CorpusIndex):
+    """CorpusIndex backed by a memory-mapped EmbeddingStore.
+
+    Scoring runs block by block directly on the stored (float32 / float16 / int8)
+    matrix; if exact_store is given, the top exact_rerank_factor * top_k candidates
+    are rescored with its float32 rows.
+    """
+
+    def __init__(
+        self,
+        corpus_ids: list,
+        store: EmbeddingStore,
+        corpus_hash: str | None = None,
+        score_block_size: int | None = None,
+        exact_store: EmbeddingStore | None = None,
+        exact_rerank_factor: int = 4,
+    ):
+        self.corpus_ids = corpus_ids
+        self.store = store
+        self.exact_store = exact_store
+        self.corpus_hash = corpus_hash
+        self.score_block_size = score_block_size or 65536
+        self.exact_rerank_factor = exact_rerank_factor
+        self._embeddings = None
+        self._normalized_embeddings = None
+
+    @property
+    def embeddings(self) -> torch.Tensor:
+        # materialized lazily, only for callers that need the full float32 matrix
+        if self._embeddings is None:
+            self._embeddings = (self.exact_store or self.store).to_tensor()
+        return self._embeddings
+
+    @property
+    def normalized_embeddings(self) -> torch.Tensor:
+        if self._normalized_embeddings is None:
+            self._normalized_embeddings = torch.nn.functional.normalize(self.embeddings, p=2, dim=1)
+        return self._normalized_embeddings
+
+    def topk(self, query_embeddings: torch.Tensor, top_k: int, score_function: str, return_sorted: bool = False):
+        if not isinstance(query_embeddings, torch.Tensor):
+            query_embeddings = torch.tensor(query_embeddings)
+        query_embeddings = query_embeddings.float().cpu()
+        if len(query_embeddings.shape) == 1:
+            query_embeddings = query_embeddings.unsqueeze(0)
+
+        if self.exact_store is None:
+            values, idx = self.store.topk(query_embeddings, top_k, score_function, self.score_block_size)
+            return values.tolist(), idx.tolist()
+
+        _, idx = self.store.topk(
+            query_embeddings, top_k * self.exact_rerank_factor, score_function, self.score_block_size
+        )
+        # 用 float32 原始向量对候选做精确重排
+        candidates = self.exact_store.rows(idx)
+        if score_function == "cos_sim":
+            query_embeddings = torch.nn.functional.normalize(query_embeddings, p=2, dim=1)
+        scores = torch.bmm(candidates, query_embeddings.unsqueeze(-1)).squeeze(-1)
+        if score_function == "cos_sim":
+            scores /= self.exact_store.norms[idx].clamp_min(1e-12)
+        scores[torch.isnan(scores)] = -1
+
+        values, pos = torch.topk(scores, min(top_k, scores.size(1)), dim=1, largest=True, sorted=True)
+        return values.tolist(), torch.gather(idx, 1, pos).tolist()
+
+
 # DenseRetrievalExactSearch is parent class for any dense model that can be used for retrieval
 # Abstract class is BaseSearch
 class DenseRetrievalExactSearch(BaseSearch):
+    # cache_dir 下以 "<prefix><corpus hash>" 命名、随 corpus 变化而被替换的文件/目录
+    corpus_cache_prefixes = ("corpus_emb_",)
+
     def __init__(self, model, batch_size: int = 128, corpus_chunk_size: int = 50000, cache_dir: str = "../cache", **kwargs):
         # model is class that provides encode_corpus() and encode_queries()
         self.model = model
@@ -50,8 +199,153 @@ class DenseRetrievalExactSearch(BaseSearch):
         self.convert_to_tensor = kwargs.get("convert_to_tensor", True)
         self.results = {}
         self.cache_dir = cache_dir
+        self.score_block_size = kwargs.get("score_block_size", None)
+        # on-disk embedding format: float32 / float16 / int8, optionally reranked with float32 rows
+        self.embedding_dtype = kwargs.get("embedding_dtype", "float32")
+        self.exact_rerank = kwargs.get("exact_rerank", True)
+        self.exact_rerank_factor = kwargs.get("exact_rerank_factor", 4)
+        # 保留最近几个 corpus 版本的 store（含当前版本），更旧的在重建索引后删除
+        self.keep_corpus_stores = max(1, kwargs.get("keep_corpus_stores", 2))
+        # query 向量缓存与检索结果缓存（LRU + TTL），size 为 0 时关闭
+        cache_ttl = kwargs.get("cache_ttl", 600.0)
+        self.query_embedding_cache = LRUCache(kwargs.get("query_cache_size", 1024), ttl=cache_ttl)
+        self.result_cache = LRUCache(kwargs.get("result_cache_size", 4096), ttl=cache_ttl)
+        # encode_workers > 1: 多进程编码，每个进程用 model_factory() 构建自己的模型
+        self.encode_workers = kwargs.get("encode_workers", 0)
+        self.model_factory = kwargs.get("model_factory", None)
+        if self.encode_workers > 1 and self.model_factory is None:
+            raise ValueError("encode_workers > 1 requires a picklable model_factory")
+        self.encode_chunk_size = kwargs.get(
+            "encode_chunk_size", 4096 if self.encode_workers > 1 else corpus_chunk_size
+        )
+        # 按文档缓存向量，corpus 变化时只重新编码新增/修改的文档
+        self.model_name = kwargs.get("model_name", type(model).__name__)
+        self.doc_cache = None
+        if kwargs.get("incremental_cache", True):
+            self.doc_cache = DocumentEmbeddingCache(
+                os.path.join(cache_dir, "doc_emb_" + hashlib.md5(self.model_name.encode("utf-8")).hexdigest()[:12])
+            )
+        self.index: CorpusIndex | None = None
+        self._indexed_corpus = None
         os.makedirs(self.cache_dir, exist_ok=True)
 
+    def build_index(self, corpus: dict[str, dict[str, str]]) -> CorpusIndex:
+        """Sort, hash and encode (or load) the corpus once and keep it resident."""
+        logger.info("Sorting Corpus by document length (Longest first)...")
+
+        if hasattr(corpus, "ids_by_length"):
+            # 列式 corpus 直接在 Arrow 中计算长度
+            corpus_ids = corpus.ids_by_length()
+        else:
+            corpus_ids = sorted(
+                corpus,
+                key=lambda k: len(corpus[k].get("title", "") + corpus[k].get("text", "")),
+                reverse=True,
+            )
+        corpus_list = CorpusView(corpus, corpus_ids)
+
+        # === 加载或计算 Corpus Embeddings ===
+        # 每个文档按 (model, title, text) 做内容寻址，整个 corpus 的 hash 由有序的文档 key 得到
+        with metrics.span("hash_corpus"):
+            doc_keys = [document_key(self.model_name, doc) for doc in corpus_list]
+            corpus_id_hash = corpus_key(doc_keys)
+        with metrics.span("load_corpus_embeddings"):
+            store = self._load_cached_corpus_embeddings(corpus_id_hash)
+
+        if store is not None:
+            logger.info("✅ Loaded cached corpus embeddings.")
+            metrics.inc("cache_hits", cache="corpus_embeddings")
+        else:
+            metrics.inc("cache_misses", cache="corpus_embeddings")
+            legacy_path = self._find_legacy_corpus_cache(corpus)
+            if legacy_path is not None:
+                logger.info(f"Converting legacy cached embeddings {legacy_path}...")
+                corpus_embeddings = torch.load(legacy_path)
+                if self.doc_cache is not None:
+                    self.doc_cache.add_missing(doc_keys, corpus_embeddings)
+            elif self.doc_cache is not None:
+                # 只编码新增/修改的文档，已删除文档的向量会在缓存压缩时丢弃
+                corpus_embeddings = self.doc_cache.get_or_encode(
+                    doc_keys, corpus_list, self._encode_chunks, chunk_size=self.encode_chunk_size
+                )
+            else:
+                corpus_embeddings = self._encode_corpus_list(corpus_list)
+            self._save_corpus_embeddings(corpus_id_hash, corpus_embeddings)
+            del corpus_embeddings
+            store = self._load_cached_corpus_embeddings(corpus_id_hash)
+            self._remove_old_corpus_caches(corpus_id_hash)
+
+        exact_store = None
+        if self.embedding_dtype != "float32" and self.exact_rerank:
+            exact_store = EmbeddingStore(self._corpus_cache_path(corpus_id_hash, "float32"))
+        # mmap 映射的字节数（实际读盘按需发生）
+        metrics.inc("bytes_loaded", store.nbytes + (exact_store.nbytes if exact_store is not None else 0))
+
+        self.index = MmapCorpusIndex(
+            corpus_ids,
+            store,
+            corpus_hash=corpus_id_hash,
+            score_block_size=self.score_block_size,
+            exact_store=exact_store,
+            exact_rerank_factor=self.exact_rerank_factor,
+        )
+        self._indexed_corpus = corpus
+        self.result_cache.clear()
+        return self.index
+
+    def _encode_corpus_list(self, corpus_list: list[dict[str, str]]) -> torch.Tensor:
+        logger.info("Encoding Corpus in batches... Warning: This might take a while!")
+        chunks = [
+            corpus_list[start:start + self.encode_chunk_size]
+            for start in range(0, len(corpus_list), self.encode_chunk_size)
+        ]
+        return torch.cat([emb.cpu() for emb in self._encode_chunks(chunks)], dim=0)
+
+    def _encode_chunks(self, chunks: list[list[dict[str, str]]]):
+        # Yields one embedding tensor per chunk, in order
+        if self.encode_workers > 1:
+            with ParallelCorpusEncoder(
+                self.model_factory, n_workers=self.encode_workers, batch_size=self.batch_size
+            ) as encoder:
+                yield from encoder.encode_chunks(chunks)
+            return
+
+        for batch_num, chunk in enumerate(chunks):
+            logger.info(f"Encoding Batch {batch_num + 1}/{len(chunks)}...")
+            with metrics.span("encode_corpus"):
+                embeddings = self.model.encode_corpus(
+                    chunk,
+                    batch_size=self.batch_size,
+                    show_progress_bar=self.show_progress_bar,
+                    convert_to_tensor=self.convert_to_tensor,
+                )
+            metrics.inc("embeddings_encoded", len(chunk), kind="corpus")
+            yield embeddings
+
+    def encode_queries(self, queries_list: list[str]) -> torch.Tensor:
+        # 命中缓存的 query 不再过 encoder，只编码未命中的；编码的是归一化后的文本，与缓存 key 一致
+        keys = [(self.model_name, normalize_query(q)) for q in queries_list]
+        cached = [self.query_embedding_cache.get(key) for key in keys]
+        missing = [i for i, emb in enumerate(cached) if emb is None]
+        metrics.inc("cache_hits", len(keys) - len(missing), cache="query_embedding")
+        metrics.inc("cache_misses", len(missing), cache="query_embedding")
+        if missing:
+            with metrics.span("encode_queries"):
+                embeddings = self.model.encode_queries(
+                    [keys[i][1] for i in missing],
+                    batch_size=self.batch_size,
+                    show_progress_bar=self.show_progress_bar,
+                    convert_to_tensor=self.convert_to_tensor,
+                )
+                embeddings = torch.as_tensor(embeddings)
+            metrics.inc("embeddings_encoded", len(missing), kind="query")
+            for i, emb in zip(missing, embeddings):
+                # clone，避免缓存的单行持有整批 tensor
+                emb = emb.clone()
+                cached[i] = emb
+                self.query_embedding_cache.set(keys[i], emb)
+        return torch.stack(cached)
+
     def search(
         self,
         corpus: dict[str, dict[str, str]],
@@ -64,93 +358,128 @@ class DenseRetrievalExactSearch(BaseSearch):
         # Create embeddings for all queries using model.encode_queries()
         # Runs semantic search against the corpus embeddings
         # Returns a ranked list with the corpus ids
+        if self.index is None or self._indexed_corpus is not corpus:
+            self.build_index(corpus)
+        return self.search_index(queries, top_k, score_function=score_function, return_sorted=return_sorted)
+
+    def search_index(
+        self,
+        queries: dict[str, str],
+        top_k: int,
+        score_function: str = "cos_sim",
+        return_sorted: bool = False,
+    ) -> dict[str, dict[str, float]]:
+        """Query the resident index: only the queries are encoded and scored."""
         if score_function not in self.score_functions:
             raise ValueError(
                 f"score function: {score_function} must be either (cos_sim) for cosine similarity or (dot) for dot product"
             )
+        if self.index is None:
+            raise RuntimeError("Index not built. Call build_index(corpus) first.")
 
-        logger.info("Encoding Queries...")
+        # 结果缓存以 (query, top_k, score_function, corpus 版本) 为 key，重建索引时清空
         query_ids = list(queries.keys())
-        self.results = {qid: {} for qid in query_ids}
-        queries_list = [queries[qid] for qid in queries]
-        query_embeddings = self.model.encode_queries(
-            queries_list,
-            batch_size=self.batch_size,
-            show_progress_bar=self.show_progress_bar,
-            convert_to_tensor=self.convert_to_tensor,
-        )
+        cache_keys = {
+            qid: (normalize_query(queries[qid]), top_k, score_function, self.index.corpus_hash)
+            for qid in query_ids
+        }
+        ranked = {qid: self.result_cache.get(cache_keys[qid]) for qid in query_ids}
+        pending = [qid for qid in query_ids if ranked[qid] is None]
+        metrics.inc("cache_hits", len(query_ids) - len(pending), cache="result")
+        metrics.inc("cache_misses", len(pending), cache="result")
 
-        logger.info("Sorting Corpus by document length (Longest first)...")
+        if pending:
+            logger.info("Encoding Queries...")
+            query_embeddings = self.encode_queries([queries[qid] for qid in pending])
 
-        corpus_ids = sorted(
-            corpus,
-            key=lambda k: len(corpus[k].get("title", "") + corpus[k].get("text", "")),
-            reverse=True,
-        )
-        corpus_list = [corpus[cid] for cid in corpus_ids]
+            logger.info(f"Scoring Function: {self.score_function_desc[score_function]} ({score_function})")
+            # 取 top-k（按列走，每个 query）; +1 以便剔除与 query 同 id 的文档
+            with metrics.span("score_topk"):
+                top_k_values, top_k_idx = self._topk(query_embeddings, top_k + 1, score_function, return_sorted)
+            with metrics.span("build_results"):
+                for query_itr, qid in enumerate(pending):
+                    ranked[qid] = self._rank(top_k_idx[query_itr], top_k_values[query_itr])
+                    self.result_cache.set(cache_keys[qid], ranked[qid])
 
-        # === 加载或计算 Corpus Embeddings ===
-        corpus_id_hash = get_corpus_id(corpus)
-        corpus_embeddings = self._load_cached_corpus_embeddings(corpus_id_hash)
+        # 返回局部结果；self.results 仅为兼容保留，并发调用时不要读取它
+        results = {
+            qid: dict([(cid, score) for cid, score in ranked[qid] if cid != qid][:top_k])
+            for qid in query_ids
+        }
+        self.results = results
+        return results
 
-        if corpus_embeddings is not None:
-            logger.info("✅ Loaded cached corpus embeddings.")
-        else:
-            logger.info("Encoding Corpus in batches... Warning: This might take a while!")
-            all_embeddings = []
-            for batch_num, corpus_start_idx in enumerate(range(0, len(corpus_list), self.corpus_chunk_size)):
-                logger.info(f"Encoding Batch {batch_num + 1}...")
-                corpus_end_idx = min(corpus_start_idx + self.corpus_chunk_size, len(corpus_list))
-                sub_embeddings = self.model.encode_corpus(
-                    corpus_list[corpus_start_idx:corpus_end_idx],
-                    batch_size=self.batch_size,
-                    show_progress_bar=self.show_progress_bar,
-                    convert_to_tensor=self.convert_to_tensor,
-                )
-                all_embeddings.append(sub_embeddings)
+    def _topk(self, query_embeddings: torch.Tensor, top_k: int, score_function: str, return_sorted: bool):
+        # subclasses (e.g. approximate engines) override this to change how candidates are scored
+        return self.index.topk(query_embeddings, top_k, score_function, return_sorted)
 
-            corpus_embeddings = torch.cat(all_embeddings, dim=0)
-            self._save_corpus_embeddings(corpus_id_hash, corpus_embeddings)
+    def _rank(self, top_k_idx: list, top_k_values: list) -> list[tuple]:
+        # 汇总结果：(corpus_id, score)，分数从高到低
+        corpus_ids = self.index.corpus_ids
+        return sorted(
+            ((corpus_ids[sub_idx], score) for sub_idx, score in zip(top_k_idx, top_k_values)),
+            key=lambda x: x[1],
+            reverse=True,
+        )
 
-        logger.info(f"Scoring Function: {self.score_function_desc[score_function]} ({score_function})")
+    def cache_stats(self) -> dict:
+        return {
+            "query_embedding": self.query_embedding_cache.stats(),
+            "result": self.result_cache.stats(),
+        }
 
-        cos_scores = self.score_functions[score_function](query_embeddings, corpus_embeddings)
-        cos_scores[torch.isnan(cos_scores)] = -1
+    def _corpus_cache_path(self, corpus_id: str, dtype: str | None = None) -> str:
+        return os.path.join(self.cache_dir, f"corpus_emb_{corpus_id}.{dtype or self.embedding_dtype}.emb")
 
-        # 取 top-k（按列走，每个 query）
-        cos_scores_top_k_values, cos_scores_top_k_idx = torch.topk(
-            cos_scores,
-            min(top_k + 1, corpus_embeddings.size(0)),
-            dim=1,
-            largest=True,
-            sorted=return_sorted,
-        )
-        cos_scores_top_k_values = cos_scores_top_k_values.cpu().tolist()
-        cos_scores_top_k_idx = cos_scores_top_k_idx.cpu().tolist()
-
-        # 汇总结果
-        for query_itr in range(len(query_embeddings)):
-            query_id = query_ids[query_itr]
-            for sub_idx, score in zip(cos_scores_top_k_idx[query_itr], cos_scores_top_k_values[query_itr]):
-                corpus_id = corpus_ids[sub_idx]
-                if corpus_id != query_id:
-                    self.results[query_id][corpus_id] = score
-        
-        for query_id in self.results:
-            top_items = sorted(self.results[query_id].items(), key=lambda x: x[1], reverse=True)
-            self.results[query_id] = dict(top_items[:top_k])
-
-        return self.results
-    
-    def _corpus_cache_path(self, corpus_id: str) -> str:
+    def _legacy_corpus_cache_path(self, corpus_id: str) -> str:
         return os.path.join(self.cache_dir, f"corpus_emb_{corpus_id}.pt")
 
-    def _load_cached_corpus_embeddings(self, corpus_id: str):
+    def _find_legacy_corpus_cache(self, corpus) -> str | None:
+        # get_corpus_id 要序列化并 hash 整个 corpus：只有缓存目录里确实有旧格式 .pt 文件时才计算
+        if not glob.glob(os.path.join(glob.escape(self.cache_dir), "corpus_emb_*.pt")):
+            return None
+        path = self._legacy_corpus_cache_path(get_corpus_id(corpus))
+        return path if os.path.exists(path) else None
+
+    def _load_cached_corpus_embeddings(self, corpus_id: str) -> EmbeddingStore | None:
         path = self._corpus_cache_path(corpus_id)
-        if os.path.exists(path):
-            return torch.load(path)
+        exact_path = self._corpus_cache_path(corpus_id, "float32")
+        needs_exact = self.embedding_dtype != "float32" and self.exact_rerank
+
+        if os.path.exists(path) and (not needs_exact or os.path.exists(exact_path)):
+            return EmbeddingStore(path)
+
+        # 已有 float32 store 时直接转换为所需格式，无需重新编码
+        if os.path.exists(exact_path):
+            logger.info(f"Converting cached embeddings {exact_path} to {self.embedding_dtype} store...")
+            self._save_corpus_embeddings(corpus_id, EmbeddingStore(exact_path).to_tensor())
+            return EmbeddingStore(path)
         return None
 
+    def _remove_old_corpus_caches(self, corpus_id: str):
+        """Deletes the caches of all but the keep_corpus_stores most recent corpora (corpus_id always stays)."""
+        stores = {}
+        for path in glob.glob(os.path.join(glob.escape(self.cache_dir), "corpus_emb_*.emb")):
+            other_id = os.path.basename(path)[len("corpus_emb_"):].split(".")[0]
+            stores[other_id] = max(stores.get(other_id, 0.0), os.path.getmtime(path))
+        stores.pop(corpus_id, None)
+        stale = sorted(stores, key=stores.get, reverse=True)[self.keep_corpus_stores - 1:]
+        if not stale:
+            return
+
+        for name in os.listdir(self.cache_dir):
+            if not any(name.startswith(prefix + other_id) for other_id in stale for prefix in self.corpus_cache_prefixes):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            # 其他进程可能同时在清理：文件已不存在时忽略
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(path)
+        logger.info(f"Removed cached embeddings of {len(stale)} old corpus version(s).")
+
     def _save_corpus_embeddings(self, corpus_id: str, embeddings: torch.Tensor):
-        path = self._corpus_cache_path(corpus_id)
-        torch.save(embeddings, path)
+        write_embedding_store(self._corpus_cache_path(corpus_id), embeddings, dtype=self.embedding_dtype)
+        if self.embedding_dtype != "float32" and self.exact_rerank:
+            write_embedding_store(self._corpus_cache_path(corpus_id, "float32"), embeddings, dtype="float32")
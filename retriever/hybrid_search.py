@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import logging
+import os
+
+from retriever.bm25 import BM25Index, tokenize
+from retriever.corpus_store import CorpusView
+from retriever.exact_search import DenseRetrievalExactSearch
+
+logger = logging.getLogger(__name__)
+
+
+class HybridSearch(DenseRetrievalExactSearch):
+    """
+    Lexical (BM25) + dense retrieval fused with reciprocal rank fusion:
+        score(d) = sum over rankings of 1 / (rrf_k + rank(d))
+
+    Each ranking contributes its top rrf_depth hits. Queries with at most
+    lexical_only_max_terms terms that have enough BM25 matches skip the encoder
+    and return the BM25 ranking alone (set it to 0 to always fuse); it is still
+    scored with RRF, so scores are on the same scale either way.
+    """
+
+    corpus_cache_prefixes = DenseRetrievalExactSearch.corpus_cache_prefixes + ("bm25_",)
+
+    def __init__(self, model, rrf_k: int = 60, rrf_depth: int = 100, lexical_only_max_terms: int = 3, **kwargs):
+        super().__init__(model, **kwargs)
+        self.rrf_k = rrf_k
+        self.rrf_depth = rrf_depth
+        self.lexical_only_max_terms = lexical_only_max_terms
+        self.bm25: BM25Index | None = None
+
+    def build_index(self, corpus):
+        index = super().build_index(corpus)
+        # BM25 与向量索引使用同一 corpus hash 与行顺序
+        path = os.path.join(self.cache_dir, f"bm25_{index.corpus_hash}")
+        if os.path.exists(os.path.join(path, "vocab.json")):
+            self.bm25 = BM25Index.load(path)
+            logger.info("✅ Loaded cached BM25 index.")
+        else:
+            self.bm25 = BM25Index.build(CorpusView(corpus, index.corpus_ids))
+            self.bm25.save(path)
+        return index
+
+    def lexical_search(self, query: str, top_k: int) -> list[tuple]:
+        rows, scores = self.bm25.search(query, top_k)
+        corpus_ids = self.index.corpus_ids
+        return [(corpus_ids[row], float(score)) for row, score in zip(rows.tolist(), scores.tolist())]
+
+    def rrf(self, rankings: list[list[tuple]], top_k: int) -> dict[str, float]:
+        fused = {}
+        for ranking in rankings:
+            for rank, (corpus_id, _) in enumerate(ranking):
+                fused[corpus_id] = fused.get(corpus_id, 0.0) + 1.0 / (self.rrf_k + rank + 1)
+        top_items = sorted(fused.items(), key=lambda x: x[1], reverse=True)
+        return dict(top_items[:top_k])
+
+    def search_index(
+        self,
+        queries: dict[str, str],
+        top_k: int,
+        score_function: str = "cos_sim",
+        return_sorted: bool = False,
+    ) -> dict[str, dict[str, float]]:
+        depth = max(top_k, self.rrf_depth)
+        results = {}
+        lexical = {}
+        dense_queries = {}
+        for qid, query in queries.items():
+            lexical[qid] = self.lexical_search(query, depth)
+            n_terms = len(tokenize(query))
+            if n_terms <= self.lexical_only_max_terms and len(lexical[qid]) >= top_k:
+                # 短关键词查询：只用 BM25，不经过 encoder；分数同样按 RRF 计算
+                results[qid] = self.rrf([lexical[qid][:top_k]], top_k)
+            else:
+                dense_queries[qid] = query
+
+        if dense_queries:
+            dense = super().search_index(dense_queries, depth, score_function=score_function, return_sorted=True)
+            for qid in dense_queries:
+                results[qid] = self.rrf([lexical[qid], list(dense[qid].items())], top_k)
+
+        self.results = results
+        return results
@@ -0,0 +1,225 @@
+from __future__ import annotations
+
+import logging
+import math
+import os
+
+import torch
+
+from retriever.exact_search import DenseRetrievalExactSearch
+
+logger = logging.getLogger(__name__)
+
+
+def spherical_kmeans(
+    vectors: torch.Tensor,
+    n_clusters: int,
+    n_iter: int = 10,
+    max_train_points: int = 256,
+    seed: int = 0,
+) -> torch.Tensor:
+    """
+    Trains k-means centroids on L2-normalized vectors (cosine distance).
+    Only a random sample of at most max_train_points * n_clusters rows is used for training.
+    :return: Tensor of shape (n_clusters, dim) with unit-norm centroids
+    """
+    generator = torch.Generator().manual_seed(seed)
+    n = vectors.size(0)
+    n_train = min(n, max_train_points * n_clusters)
+    train = vectors[torch.randperm(n, generator=generator)[:n_train]].float()
+
+    centroids = train[torch.randperm(n_train, generator=generator)[:n_clusters]].clone()
+    for _ in range(n_iter):
+        assign = torch.mm(train, centroids.transpose(0, 1)).argmax(dim=1)
+        sums = torch.zeros_like(centroids).index_add_(0, assign, train)
+        counts = torch.bincount(assign, minlength=n_clusters)
+
+        # 空簇用随机样本重新初始化
+        empty = (counts == 0).nonzero(as_tuple=True)[0]
+        if len(empty) > 0:
+            sums[empty] = train[torch.randint(n_train, (len(empty),), generator=generator)]
+        centroids = torch.nn.functional.normalize(sums, p=2, dim=1)
+    return centroids
+
+
+def resolve_nlist(n: int, nlist: int | None = None) -> int:
+    """Number of inverted lists actually used for n rows (default 4 * sqrt(n))."""
+    return max(1, min(n, nlist or int(4 * math.sqrt(n))))
+
+
+class IVFIndex:
+    """
+    Inverted-file index: corpus rows are grouped by their nearest k-means centroid and
+    stored contiguously per list, so a query only scores the rows of its nprobe closest lists.
+
+    Vectors are kept unit-normalized in storage_dtype (float16 by default) together with
+    their original norms, which is enough to recover both cosine and dot-product scores.
+    Passing trained (the dict returned by state()) skips k-means and list assignment.
+    """
+
+    def __init__(
+        self,
+        embeddings: torch.Tensor,
+        nlist: int | None = None,
+        kmeans_iters: int = 10,
+        storage_dtype: torch.dtype = torch.float16,
+        assign_chunk_size: int = 65536,
+        seed: int = 0,
+        trained: dict | None = None,
+    ):
+        embeddings = embeddings.float().cpu()
+        n = embeddings.size(0)
+
+        norms = embeddings.norm(p=2, dim=1)
+        unit = torch.nn.functional.normalize(embeddings, p=2, dim=1)
+        if trained is not None:
+            self.centroids = trained["centroids"]
+            self.order = trained["order"]
+            self.offsets = trained["offsets"]
+            self.nlist = self.centroids.size(0)
+        else:
+            self.nlist = resolve_nlist(n, nlist)
+            self.centroids = spherical_kmeans(unit, self.nlist, n_iter=kmeans_iters, seed=seed)
+
+            assign = torch.cat([
+                torch.mm(unit[start:start + assign_chunk_size], self.centroids.transpose(0, 1)).argmax(dim=1)
+                for start in range(0, n, assign_chunk_size)
+            ])
+
+            # 按簇排序后连续存放：list c 对应 order[offsets[c]:offsets[c + 1]]
+            self.order = torch.argsort(assign, stable=True)
+            counts = torch.bincount(assign, minlength=self.nlist)
+            self.offsets = torch.zeros(self.nlist + 1, dtype=torch.long)
+            self.offsets[1:] = torch.cumsum(counts, dim=0)
+        self.vectors = unit[self.order].to(storage_dtype)
+        self.norms = norms[self.order]
+
+    def state(self) -> dict:
+        """The trained part of the index (centroids and list layout), for IVFIndex(..., trained=state)."""
+        return {"centroids": self.centroids, "order": self.order, "offsets": self.offsets}
+
+    def __len__(self) -> int:
+        return self.order.size(0)
+
+    def search(self, query_embeddings: torch.Tensor, top_k: int, nprobe: int, score_function: str):
+        """
+        Scores each query against the rows of its nprobe nearest lists.
+        :return: (values, corpus row indices) as lists of lists, best first
+        """
+        queries = query_embeddings.float().cpu()
+        if len(queries.shape) == 1:
+            queries = queries.unsqueeze(0)
+        queries_unit = torch.nn.functional.normalize(queries, p=2, dim=1)
+        nprobe = min(nprobe, self.nlist)
+        probes = torch.topk(torch.mm(queries_unit, self.centroids.transpose(0, 1)), nprobe, dim=1).indices
+
+        all_values, all_idx = [], []
+        for query_itr in range(queries.size(0)):
+            slices = [
+                slice(int(self.offsets[c]), int(self.offsets[c + 1]))
+                for c in probes[query_itr].tolist()
+            ]
+            rows = torch.cat([self.order[s] for s in slices])
+            if rows.numel() == 0:
+                all_values.append([])
+                all_idx.append([])
+                continue
+            vecs = torch.cat([self.vectors[s] for s in slices]).float()
+
+            if score_function == "cos_sim":
+                scores = torch.mv(vecs, queries_unit[query_itr])
+            else:
+                norms = torch.cat([self.norms[s] for s in slices])
+                scores = torch.mv(vecs, queries[query_itr]) * norms
+            scores[torch.isnan(scores)] = -1
+
+            values, idx = torch.topk(scores, min(top_k, scores.size(0)))
+            all_values.append(values.tolist())
+            all_idx.append(rows[idx].tolist())
+        return all_values, all_idx
+
+
+class IVFSearch(DenseRetrievalExactSearch):
+    """
+    Approximate dense retrieval over the same cached corpus embeddings as DenseRetrievalExactSearch.
+
+    Recall knobs:
+      - nlist: number of inverted lists (default 4 * sqrt(N))
+      - nprobe: lists visited per query, higher means better recall and slower queries
+      - rerank: rescore the top rerank_factor * top_k candidates exactly with float32 embeddings
+
+    The trained lists are cached in cache_dir per (corpus hash, nlist, kmeans_iters), so
+    k-means only runs when the corpus or these settings change.
+    """
+
+    corpus_cache_prefixes = DenseRetrievalExactSearch.corpus_cache_prefixes + ("ivf_",)
+
+    def __init__(
+        self,
+        model,
+        nlist: int | None = None,
+        nprobe: int = 8,
+        rerank: bool = True,
+        rerank_factor: int = 4,
+        kmeans_iters: int = 10,
+        storage_dtype: torch.dtype = torch.float16,
+        **kwargs,
+    ):
+        super().__init__(model, **kwargs)
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.rerank = rerank
+        self.rerank_factor = rerank_factor
+        self.kmeans_iters = kmeans_iters
+        self.storage_dtype = storage_dtype
+        self.ivf: IVFIndex | None = None
+
+    def build_index(self, corpus: dict[str, dict[str, str]]):
+        index = super().build_index(corpus)
+        embeddings = index.embeddings
+        nlist = resolve_nlist(embeddings.size(0), self.nlist)
+        path = os.path.join(self.cache_dir, f"ivf_{index.corpus_hash}_{nlist}_{self.kmeans_iters}.pt")
+        if os.path.exists(path):
+            self.ivf = IVFIndex(embeddings, storage_dtype=self.storage_dtype, trained=torch.load(path))
+            logger.info(f"✅ Loaded cached IVF index with {self.ivf.nlist} lists.")
+            return index
+
+        logger.info("Building IVF index...")
+        self.ivf = IVFIndex(
+            embeddings,
+            nlist=nlist,
+            kmeans_iters=self.kmeans_iters,
+            storage_dtype=self.storage_dtype,
+        )
+        tmp_path = path + ".tmp"
+        torch.save(self.ivf.state(), tmp_path)
+        os.replace(tmp_path, path)
+        logger.info(f"✅ IVF index built with {self.ivf.nlist} lists.")
+        return index
+
+    def _topk(self, query_embeddings: torch.Tensor, top_k: int, score_function: str, return_sorted: bool):
+        n_candidates = top_k * self.rerank_factor if self.rerank else top_k
+        values, idx = self.ivf.search(query_embeddings, n_candidates, self.nprobe, score_function)
+        if not self.rerank:
+            return values, idx
+
+        # 对候选集做精确重排（float32，与 exact search 同一打分）
+        reranked_values, reranked_idx = [], []
+        for query_itr, candidates in enumerate(idx):
+            if not candidates:
+                reranked_values.append([])
+                reranked_idx.append([])
+                continue
+            rows = torch.tensor(candidates, dtype=torch.long)
+            query = query_embeddings[query_itr].unsqueeze(0)
+            if score_function == "cos_sim":
+                query = torch.nn.functional.normalize(query.float(), p=2, dim=1)
+                corpus_vecs = self.index.normalized_embeddings[rows]
+            else:
+                corpus_vecs = self.index.embeddings[rows]
+            scores = torch.mm(query.to(corpus_vecs.device, corpus_vecs.dtype), corpus_vecs.transpose(0, 1))[0]
+            scores[torch.isnan(scores)] = -1
+            best_values, best = torch.topk(scores, min(top_k, scores.size(0)))
+            reranked_values.append(best_values.cpu().tolist())
+            reranked_idx.append(rows[best.cpu()].tolist())
+        return reranked_values, reranked_idx
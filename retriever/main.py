@@ -1,22 +1,97 @@
-from datasets import load_dataset
-from sentence_transformers import SentenceTransformer
+import contextlib
+import functools
+import importlib
+import logging
+import threading
+import time
 import types
 from typing import List, Dict
-import torch
-from retriever.exact_search import DenseRetrievalExactSearch
+from retriever import metrics
+from retriever.service import RetrievalService
 import json
 import os
 
+# torch / datasets / sentence_transformers 等重依赖在函数内按需导入，
+# 这样 import 本模块（例如 frontend 启动时）几乎没有开销
+
+logger = logging.getLogger(__name__)
+
 # 模型与检索器全局缓存
 searcher = None
 corpus = None
+service = None
+# 按段落建索引时的 PassageCorpus（否则为 None）
+passages = None
+passage_agg = "max"
+# 段落检索时多取的候选数，聚合回文档后仍能凑满 top_k
+PASSAGE_OVERSAMPLE = 4
+# 第二阶段 cross-encoder 重排器（未启用时为 None）
+reranker = None
 
-def get_searcher_and_corpus(
-    corpus_path="../retriever/data/corpus.csv",
-    model_name="jxm/cde-small-v2",
-    ratio=1.0
-):
-    global searcher, corpus
+# search_type -> BaseSearch 实现（"module:Class"，用到时才导入）
+SEARCH_TYPES = {
+    "exact": "retriever.exact_search:DenseRetrievalExactSearch",
+    "ivf": "retriever.ivf_search:IVFSearch",
+    "hybrid": "retriever.hybrid_search:HybridSearch",
+    "sharded": "retriever.sharded_search:ShardedSearch",
+}
+
+# 启动各阶段耗时（秒）与就绪状态
+startup_timings = {}
+ready = threading.Event()
+warmup_error = None
+_warmup_thread = None
+
+
+@contextlib.contextmanager
+def timed_phase(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup_timings[name] = time.perf_counter() - start
+        metrics.observe(f"startup_{name}", startup_timings[name])
+        logger.info(f"Startup phase {name}: {startup_timings[name]:.2f}s")
+        print(f"⏱️ {name}: {startup_timings[name]:.2f}s")
+
+
+def resolve_search_type(search_type):
+    if search_type not in SEARCH_TYPES:
+        raise ValueError(f"search_type: {search_type} must be one of {list(SEARCH_TYPES)}")
+    module_name, class_name = SEARCH_TYPES[search_type].split(":")
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+# patch encode_xxx 方法（模块级函数，便于多进程编码时 pickle model_factory）
+# 按 token 预算分桶组 batch，减少 padding 浪费
+def encode_queries(self, queries: List[str], **kwargs):
+    from retriever.batching import encode_bucketed
+    return encode_bucketed(self, queries, max_batch_tokens=self.max_batch_tokens, **kwargs)
+
+
+def encode_corpus(self, corpus_list: List[Dict[str, str]], **kwargs):
+    from retriever.batching import encode_bucketed
+    texts = [(entry.get("title") or "") + " " + (entry.get("text") or "") for entry in corpus_list]
+    return encode_bucketed(self, texts, max_batch_tokens=self.max_batch_tokens, **kwargs)
+
+
+def load_model(model_name="jxm/cde-small-v2", device=None, max_batch_tokens=16384):
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    if device is None:
+        device = torch.device("mps" if torch.backends.mps.is_available() else "cpu")
+    model = SentenceTransformer(model_name, trust_remote_code=True)
+    model = model.to(device)
+    model.max_batch_tokens = max_batch_tokens
+
+    model.encode_queries = types.MethodType(encode_queries, model)
+    model.encode_corpus = types.MethodType(encode_corpus, model)
+    return model
+
+
+def load_csv_corpus(corpus_path, ratio=1.0):
+    from datasets import load_dataset
 
     dataset = load_dataset("csv", data_files=corpus_path, split="train")
     if "id" in dataset.column_names:
@@ -33,7 +108,7 @@ def get_searcher_and_corpus(
         print("⚠️ Some texts are None")
 
     sample_size = int(len(dataset) * ratio)
-    corpus = {
+    return {
         example["id"]: {
             "title": example["title"],
             "text": example["text"]
@@ -41,42 +116,177 @@ def get_searcher_and_corpus(
         for example in dataset.select(range(sample_size))
     }
 
-    device = torch.device("mps" if torch.backends.mps.is_available() else "cpu")
-    model = SentenceTransformer(model_name, trust_remote_code=True)
-    model = model.to(device)
 
-    # patch encode_xxx 方法
-    def encode_queries(self, queries: List[str], **kwargs):
-        return self.encode(queries, **kwargs)
+def get_searcher_and_corpus(
+    corpus_path="../retriever/data/corpus.csv",
+    model_name="jxm/cde-small-v2",
+    ratio=1.0,
+    search_type="exact",
+    search_kwargs=None,
+    encode_workers=0,
+    passage_words=None,
+    passage_overlap=50,
+    aggregate="max",
+    rerank_model=None,
+    rerank_kwargs=None,
+):
+    """
+    passage_words: if set, documents are split into overlapping passages of this many words and
+    the passages are indexed; rag_retrieve folds passage scores back to documents with aggregate
+    ("max" or "sum") and returns the best passage of each document.
+    rerank_model: if set, a cross-encoder that reranks the first-stage top candidates
+    (rerank_kwargs go to CrossEncoderReranker, e.g. candidates / latency_budget_ms).
+    """
+    global searcher, corpus, service, passages, passage_agg, reranker
 
-    def encode_corpus(self, corpus_list: List[Dict[str, str]], **kwargs):
-        texts = [entry.get("title", "") + " " + entry.get("text", "") for entry in corpus_list]
-        return self.encode(texts, **kwargs)
+    searcher_cls = resolve_search_type(search_type)
 
-    model.encode_queries = types.MethodType(encode_queries, model)
-    model.encode_corpus = types.MethodType(encode_corpus, model)
+    with timed_phase("load_corpus"):
+        arrow_path = os.path.splitext(corpus_path)[0] + ".arrow"
+        # corpus.arrow 与 corpus.csv 一起生成；比 CSV 旧说明 CSV 之后被单独重新生成过，不能再用
+        if os.path.exists(arrow_path) and (
+            not os.path.exists(corpus_path) or os.path.getmtime(arrow_path) >= os.path.getmtime(corpus_path)
+        ):
+            from retriever.corpus_store import ArrowCorpus
 
+            # 列式 corpus：mmap 打开，title/text 在取结果时才按行读取
+            corpus = ArrowCorpus(arrow_path)
+            if ratio < 1.0:
+                corpus = ArrowCorpus(arrow_path, limit=int(len(corpus) * ratio))
+            print(f"✅ Arrow corpus contains: {len(corpus)} documents")
+        else:
+            corpus = load_csv_corpus(corpus_path, ratio)
+
+    with timed_phase("load_model"):
+        model = load_model(model_name)
     if hasattr(model, "encode_queries") and hasattr(model, "encode_corpus"):
         print("✅ Model Loaded Successfully!")
 
-    searcher = DenseRetrievalExactSearch(model=model, batch_size=120, corpus_chunk_size=50000)
+    # search_kwargs 透传给检索器，例如 ivf 的 nlist / nprobe / rerank
+    searcher = searcher_cls(
+        model=model,
+        batch_size=120,
+        corpus_chunk_size=50000,
+        model_name=model_name,
+        encode_workers=encode_workers,
+        model_factory=functools.partial(load_model, model_name, "cpu"),
+        **(search_kwargs or {}),
+    )
+    # 一次性构建常驻索引，之后每个 query 只做编码 + 打分
+    passages = None
+    passage_agg = aggregate
+    if passage_words:
+        from retriever.chunking import PassageCorpus
+
+        with timed_phase("split_passages"):
+            passages = PassageCorpus(corpus, max_words=passage_words, overlap=passage_overlap)
+
+    with timed_phase("build_index"):
+        searcher.build_index(passages if passages is not None else corpus)
+    # 并发的 rag_retrieve 调用在这里被合并成一个 batch 编码和打分
+    if service is not None:
+        service.close()
+    service = RetrievalService(searcher)
+
+    reranker = None
+    if rerank_model:
+        from retriever.rerank import CrossEncoderReranker
+
+        with timed_phase("load_reranker"):
+            reranker = CrossEncoderReranker(rerank_model, **(rerank_kwargs or {}))
     return searcher, corpus
 
 
+def warmup(**kwargs):
+    """Loads corpus, model and index, then runs one dummy query encode so the first real query is fast."""
+    global warmup_error
+    try:
+        start = time.perf_counter()
+        with timed_phase("import"):
+            import torch  # noqa: F401
+            import sentence_transformers  # noqa: F401
+        get_searcher_and_corpus(**kwargs)
+        with timed_phase("prewarm"):
+            # 直接调用模型而不是 searcher.encode_queries，预热不在 query 缓存里留下条目
+            searcher.model.encode_queries(["warmup"], batch_size=searcher.batch_size, convert_to_tensor=True)
+            if reranker is not None:
+                reranker.model.predict([("warmup", "warmup")], show_progress_bar=False)
+        startup_timings["total"] = time.perf_counter() - start
+        print(f"✅ Retriever ready in {startup_timings['total']:.2f}s")
+    except Exception as e:
+        warmup_error = e
+        logger.exception("Retriever warm-up failed")
+    finally:
+        ready.set()
+
+
+def start_warmup(**kwargs):
+    """Starts warmup() on a background thread (once) and returns immediately."""
+    global _warmup_thread
+    # RETRIEVER_METRICS_PORT 设置时开启 /metrics 端点
+    metrics.serve_from_env()
+    if _warmup_thread is None:
+        _warmup_thread = threading.Thread(target=warmup, kwargs=kwargs, name="retriever-warmup", daemon=True)
+        _warmup_thread.start()
+    return _warmup_thread
+
+
+def is_ready():
+    return ready.is_set() and warmup_error is None and service is not None
+
+
+def get_warmup_error():
+    """The exception warm-up failed with, or None (still warming up, or ready)."""
+    return warmup_error
+
+
 def rag_retrieve(query: str, top_k=10, score_function="cos_sim"):
     """用于 frontend 调用：基于 query 返回 top_k 检索文档"""
-    if searcher is None or corpus is None:
+    with metrics.span("rag_retrieve"):
+        return _rag_retrieve(query, top_k, score_function)
+
+
+def _rag_retrieve(query, top_k, score_function):
+    if _warmup_thread is not None:
+        ready.wait()
+        if warmup_error is not None:
+            raise RuntimeError(f"Retriever warm-up failed: {warmup_error}")
+    if service is None or corpus is None:
         raise RuntimeError("Retriever not initialized. Call get_searcher_and_corpus() first.")
 
-    results = searcher.search(corpus=corpus, queries={"1": query}, top_k=top_k, score_function=score_function)
-    doc_list = []
-    for doc_id in results["1"]:
-        entry = corpus[int(doc_id)]
-        doc_list.append({
-            "title": entry["title"],
-            "text": entry["text"]
-        })
-    return doc_list
+    # 启用重排时第一阶段取更宽的候选集，只对这些候选跑 cross-encoder
+    first_k = max(top_k, reranker.candidates) if reranker is not None else top_k
+
+    if passages is not None:
+        with metrics.span("retrieve"):
+            passage_results = service.retrieve(query, top_k=first_k * PASSAGE_OVERSAMPLE, score_function=score_function)
+        doc_list = []
+        for doc_id, _, passage_id in passages.aggregate(passage_results, first_k, agg=passage_agg):
+            entry = corpus[doc_id]
+            doc_list.append({
+                "id": passage_id,
+                "title": entry["title"],
+                "text": entry["text"],
+                "passage": passages[passage_id]["text"],
+            })
+    else:
+        with metrics.span("retrieve"):
+            results = service.retrieve(query, top_k=first_k, score_function=score_function)
+        doc_list = []
+        for doc_id in results:
+            entry = corpus[int(doc_id)]
+            doc_list.append({
+                "id": int(doc_id),
+                "title": entry["title"],
+                "text": entry["text"]
+            })
+
+    if reranker is not None:
+        with metrics.span("rerank"):
+            doc_list, scores = reranker.rerank(query, doc_list)
+        if scores is None:
+            metrics.inc("rerank_fallbacks")
+    return [{k: v for k, v in d.items() if k != "id"} for d in doc_list[:top_k]]
 
 
 def clear_terminal():
@@ -85,8 +295,9 @@ def clear_terminal():
 
 # CLI 交互接口（保留）
 if __name__ == "__main__":
-    get_searcher_and_corpus()
     clear_terminal()
+    # 后台加载，命令行提示立即出现；第一次查询会等待加载完成
+    start_warmup()
     print("\n🧠 Welcome to the Dense Retriever Agent! Type query: <your query> to search, or type exit to quit. Type help for more commands.")
 
     while True:
@@ -102,6 +313,10 @@ if __name__ == "__main__":
                 preview = "\n".join(doc["text"].strip().splitlines()[:5])
                 print(f"[{i}] {doc['title']}\n{preview}\n")
         elif user_input.startswith("show:"):
+            ready.wait()
+            if warmup_error is not None:
+                print(f"❌ Retriever warm-up failed: {warmup_error}")
+                continue
             try:
                 doc_id = int(user_input[len("show:"):].strip())
                 if doc_id in corpus:
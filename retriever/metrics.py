@@ -0,0 +1,278 @@
+"""
+Lightweight in-process metrics: per-stage timing spans aggregated into histograms, plus counters,
+rendered in the Prometheus text format and optionally served on a local HTTP port.
+
+Disabled by default: span() then returns a shared no-op context manager and inc()/observe()
+return immediately. Enable with RETRIEVER_METRICS=1 (or enable()); RETRIEVER_METRICS_PORT
+also starts the /metrics endpoint, and while enabled the per-stage summary is logged every
+RETRIEVER_METRICS_LOG_SECONDS (default 300) and at exit (see serve_from_env()).
+"""
+from __future__ import annotations
+
+import atexit
+import bisect
+import contextlib
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "retriever"
+# 秒；覆盖从亚毫秒级打分到数十秒的 LLM 回答
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+enabled = os.environ.get("RETRIEVER_METRICS", "").lower() in ("1", "true", "yes")
+# 根 span 超过该时长时，把各子阶段耗时打到日志里
+slow_span_seconds = float(os.environ.get("RETRIEVER_SLOW_SPAN_SECONDS", 1.0))
+
+_lock = threading.Lock()
+_counters: dict[tuple, float] = {}
+_histograms: dict[str, "Histogram"] = {}
+_local = threading.local()
+_NULL_SPAN = contextlib.nullcontext()
+_server = None
+_summary_thread = None
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Upper bucket bound holding the q-th observation (inf if it is in the overflow bucket)."""
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+def enable(on: bool = True):
+    global enabled
+    enabled = on
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+def inc(name: str, value: float = 1, **labels):
+    """Adds value to the counter {PREFIX}_{name}_total{labels}."""
+    if not enabled:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(stage: str, seconds: float):
+    """Records one duration of stage in the {PREFIX}_stage_seconds histogram."""
+    if not enabled:
+        return
+    with _lock:
+        histogram = _histograms.get(stage)
+        if histogram is None:
+            histogram = _histograms[stage] = Histogram()
+        histogram.observe(seconds)
+
+
+class _Span:
+    __slots__ = ("stage", "start", "children", "links")
+
+    def __init__(self, stage: str, links=()):
+        self.stage = stage
+        # (stage, seconds, 子阶段列表)
+        self.children = []
+        self.links = links
+
+    def __enter__(self):
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+        stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        stack = _local.stack
+        stack.pop()
+        observe(self.stage, elapsed)
+        record = (self.stage, elapsed, self.children)
+        # 在别的线程上代为完成的工作（如批处理线程），计入发起请求的 span
+        for parent in self.links:
+            parent.children.append(record)
+        if stack:
+            stack[-1].children.append(record)
+        elif elapsed >= slow_span_seconds:
+            logger.warning(f"Slow {self.stage}: {elapsed * 1000:.1f}ms ({_format_breakdown(self.children)})")
+        else:
+            logger.debug(f"{self.stage}: {elapsed * 1000:.1f}ms")
+        return False
+
+
+def _format_breakdown(children) -> str:
+    return ", ".join(
+        f"{stage}={seconds * 1000:.1f}ms" + (f" [{_format_breakdown(nested)}]" if nested else "")
+        for stage, seconds, nested in children
+    )
+
+
+def span(stage: str, links=()):
+    """
+    Times a block as one stage. Spans nest per thread; a slow outermost span logs the timings
+    of the stages below it. links are spans from other threads (see current_span()) this block
+    works on behalf of: its timing and breakdown are added to each of them as well.
+    Use observe() in async code, where coroutines share a thread.
+    """
+    if not enabled:
+        return _NULL_SPAN
+    return _Span(stage, links)
+
+
+def current_span():
+    """The innermost open span of this thread (None if there is none), to pass as a link to another thread."""
+    if not enabled:
+        return None
+    stack = getattr(_local, "stack", None)
+    return stack[-1] if stack else None
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted((stage, h.buckets, list(h.counts), h.sum, h.count) for stage, h in _histograms.items())
+
+    typed = set()
+    for (name, labels), value in counters:
+        metric = f"{PREFIX}_{name}_total"
+        if metric not in typed:
+            typed.add(metric)
+            lines.append(f"# TYPE {metric} counter")
+        lines.append(f"{metric}{_format_labels(labels)} {value:g}")
+
+    if histograms:
+        metric = f"{PREFIX}_stage_seconds"
+        lines.append(f"# TYPE {metric} histogram")
+        for stage, buckets, counts, total, count in histograms:
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{metric}_bucket{{stage="{stage}",le="{bound:g}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{stage="{stage}",le="+Inf"}} {count}')
+            lines.append(f'{metric}_sum{{stage="{stage}"}} {total:.6f}')
+            lines.append(f'{metric}_count{{stage="{stage}"}} {count}')
+    return "\n".join(lines) + "\n"
+
+
+def summary() -> dict:
+    """{stage: {count, mean_ms, p50_ms, p95_ms}} from the histograms (bucket upper bounds)."""
+    with _lock:
+        return {
+            stage: {
+                "count": h.count,
+                "mean_ms": h.sum / h.count * 1000 if h.count else 0.0,
+                "p50_ms": h.quantile(0.5) * 1000,
+                "p95_ms": h.quantile(0.95) * 1000,
+            }
+            for stage, h in _histograms.items()
+        }
+
+
+def log_summary():
+    stages = summary()
+    if not stages:
+        return
+    logger.info("Stage timings:")
+    for stage, stats in sorted(stages.items()):
+        logger.info(
+            f"  {stage}: n={stats['count']} mean={stats['mean_ms']:.1f}ms "
+            f"p50<={stats['p50_ms']:.1f}ms p95<={stats['p95_ms']:.1f}ms"
+        )
+
+
+def log_summary_every(seconds: float):
+    """Logs the stage summary every seconds on a daemon thread, and once at exit (once per process)."""
+    global _summary_thread
+    if _summary_thread is not None or seconds <= 0:
+        return
+    if not logger.hasHandlers():
+        # 应用没有配置 logging 时，INFO 级的汇总会被丢弃：给本模块单独挂一个 handler
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+
+    def run():
+        while True:
+            time.sleep(seconds)
+            log_summary()
+
+    _summary_thread = threading.Thread(target=run, name="metrics-summary", daemon=True)
+    _summary_thread.start()
+    atexit.register(log_summary)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port: int = 9464, host: str = "127.0.0.1"):
+    """Serves GET /metrics on a daemon thread (once); enables collection. Returns the server."""
+    global _server
+    enable()
+    if _server is None:
+        _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+        logger.info(f"Metrics endpoint on http://{host}:{_server.server_address[1]}/metrics")
+    return _server
+
+
+def serve_from_env():
+    """Starts the /metrics endpoint if RETRIEVER_METRICS_PORT is set, and the summary log if metrics are enabled."""
+    server = None
+    port = os.environ.get("RETRIEVER_METRICS_PORT")
+    if port:
+        server = serve(int(port), os.environ.get("RETRIEVER_METRICS_HOST", "127.0.0.1"))
+    if enabled:
+        log_summary_every(float(os.environ.get("RETRIEVER_METRICS_LOG_SECONDS", 300)))
+    return server
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import logging
+import multiprocessing as mp
+import os
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+# 每个 worker 进程各自持有一份模型
+_worker_model = None
+_worker_batch_size = 128
+
+
+def _init_worker(model_factory, batch_size: int, num_threads: int):
+    global _worker_model, _worker_batch_size
+    torch.set_num_threads(num_threads)
+    _worker_model = model_factory()
+    _worker_batch_size = batch_size
+
+
+def _encode_chunk(docs: list[dict[str, str]]):
+    embeddings = _worker_model.encode_corpus(
+        docs,
+        batch_size=_worker_batch_size,
+        show_progress_bar=False,
+        convert_to_tensor=True,
+    )
+    # numpy 数组跨进程传输比 tensor 更稳妥
+    return embeddings.detach().cpu().float().numpy()
+
+
+class ParallelCorpusEncoder:
+    """
+    Encodes corpus chunks on a pool of worker processes, each with its own model copy.
+
+    model_factory must be picklable (a module-level function or functools.partial) and
+    return a model providing encode_corpus(). Results are yielded in submission order.
+    """
+
+    def __init__(self, model_factory, n_workers: int | None = None, batch_size: int = 128, threads_per_worker: int | None = None):
+        self.model_factory = model_factory
+        self.n_workers = n_workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // self.n_workers)
+        self._pool = None
+
+    def _get_pool(self):
+        if self._pool is None:
+            logger.info(
+                f"Starting {self.n_workers} encoder workers ({self.threads_per_worker} threads each)..."
+            )
+            # spawn: fork 之后再使用 torch 线程池并不安全
+            self._pool = mp.get_context("spawn").Pool(
+                self.n_workers,
+                initializer=_init_worker,
+                initargs=(self.model_factory, self.batch_size, self.threads_per_worker),
+            )
+        return self._pool
+
+    def encode_chunks(self, chunks: list[list[dict[str, str]]]):
+        """Yields one float32 tensor per chunk, in order."""
+        for embeddings in self._get_pool().imap(_encode_chunk, chunks):
+            yield torch.from_numpy(embeddings)
+
+    def close(self):
+        """Waits for the workers to finish their queued chunks and stops them."""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def terminate(self):
+        """Stops the workers right away, dropping any chunks still queued or being encoded."""
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # 出错、Ctrl-C 或调用方提前停止迭代（GeneratorExit）时，imap 已排好的剩余 chunk 不再需要：
+        # 直接终止，而不是等它们全部编码完（被 SIGINT 打断的 worker 也永远不会返回）
+        if exc_type is None:
+            self.close()
+        else:
+            self.terminate()
@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import logging
+import time
+
+from retriever.query_cache import LRUCache, normalize_query
+
+logger = logging.getLogger(__name__)
+
+
+class CrossEncoderReranker:
+    """
+    Second retrieval stage: rescores a small first-stage candidate set with a cross-encoder.
+
+    Pairs are scored in batches of batch_size; (query, doc key) scores are cached so repeated
+    queries only score new candidates. If scoring would exceed latency_budget_ms the candidates
+    are returned in their first-stage order instead (latency_budget_ms=None disables the budget).
+    The cost of a batch is estimated from a running average of the per-pair time across calls,
+    so the budget is checked before the first batch too.
+    """
+
+    # running average 中最新一次测量的权重
+    COST_SMOOTHING = 0.2
+
+    def __init__(
+        self,
+        model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2",
+        candidates: int = 100,
+        batch_size: int = 32,
+        max_length: int = 512,
+        max_chars: int = 2000,
+        latency_budget_ms: float | None = 500.0,
+        cache_size: int = 100000,
+        device: str = "cpu",
+        model=None,
+    ):
+        if model is None:
+            from sentence_transformers import CrossEncoder
+
+            model = CrossEncoder(model_name, max_length=max_length, device=device)
+        self.model = model
+        self.candidates = candidates
+        self.batch_size = batch_size
+        self.max_chars = max_chars
+        self.latency_budget_ms = latency_budget_ms
+        self.cache = LRUCache(maxsize=cache_size)
+        self.fallbacks = 0
+        # 每个 (query, doc) pair 的平均打分耗时（ms），跨调用累积；None 表示还没有测量
+        self.pair_ms = None
+
+    def pair_text(self, doc: dict) -> str:
+        # 交叉编码器最多看 max_length 个 token，先截断字符避免无谓的分词开销
+        text = doc.get("passage") or doc.get("text") or ""
+        return ((doc.get("title") or "") + " " + text)[: self.max_chars]
+
+    def rerank(self, query: str, docs: list[dict], key=lambda doc: doc["id"]) -> tuple[list[dict], list[float] | None]:
+        """
+        docs: first-stage candidates, best first; key(doc) identifies a doc in the score cache.
+        :return: (docs in reranked order, cross-encoder scores), or (docs unchanged, None) when the
+                 latency budget ran out
+        """
+        start = time.perf_counter()
+        query_key = normalize_query(query)
+        scores = [self.cache.get((query_key, key(doc))) for doc in docs]
+        missing = [i for i, score in enumerate(scores) if score is None]
+
+        for offset in range(0, len(missing), self.batch_size):
+            batch = missing[offset:offset + self.batch_size]
+            if self.latency_budget_ms is not None and self.pair_ms is not None:
+                # 按历史平均耗时估计这个 batch（包括第一个），超预算则放弃重排
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                if elapsed_ms + self.pair_ms * len(batch) > self.latency_budget_ms:
+                    self.fallbacks += 1
+                    if not offset:
+                        # 一个 batch 都没跑就不会有新的测量：让估计慢慢回落，避免一次偶然的慢调用
+                        # （如模型首次运行）永久关闭重排
+                        self.pair_ms *= 1 - self.COST_SMOOTHING
+                    logger.warning(
+                        f"Rerank budget of {self.latency_budget_ms:.0f}ms exceeded after "
+                        f"{offset}/{len(missing)} pairs, keeping first-stage order."
+                    )
+                    return docs, None
+            batch_start = time.perf_counter()
+            batch_scores = self.model.predict(
+                [(query, self.pair_text(docs[i])) for i in batch],
+                batch_size=self.batch_size,
+                show_progress_bar=False,
+            )
+            pair_ms = (time.perf_counter() - batch_start) * 1000 / len(batch)
+            if self.pair_ms is None:
+                self.pair_ms = pair_ms
+            else:
+                self.pair_ms += self.COST_SMOOTHING * (pair_ms - self.pair_ms)
+            for i, score in zip(batch, batch_scores):
+                scores[i] = float(score)
+                self.cache.set((query_key, key(docs[i])), scores[i])
+
+        order = sorted(range(len(docs)), key=lambda i: scores[i], reverse=True)
+        return [docs[i] for i in order], [scores[i] for i in order]
@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from retriever import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class _Request:
+    __slots__ = ("query", "top_k", "score_function", "future", "span")
+
+    def __init__(self, query: str, top_k: int, score_function: str):
+        self.query = query
+        self.top_k = top_k
+        self.score_function = score_function
+        self.future = Future()
+        # 调用方当前的 span：批处理线程上的耗时计入它
+        self.span = metrics.current_span()
+
+
+class RetrievalService:
+    """
+    Thread-safe front of a searcher that micro-batches concurrent queries.
+
+    Callers block in retrieve(); a single background thread collects requests for up to
+    max_wait_ms (or until max_batch_size requests are queued), encodes and scores them
+    with one search_index() call per score function and hands each caller its own result.
+    """
+
+    def __init__(self, searcher, max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self.searcher = searcher
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: queue.Queue = queue.Queue()
+        self._closed = False
+        # submit 与 close 互斥，保证关闭哨兵之后不会再有请求入队
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="retrieval-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, query: str, top_k: int = 10, score_function: str = "cos_sim") -> Future:
+        request = _Request(query, top_k, score_function)
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("RetrievalService is closed")
+            self._queue.put(request)
+        return request.future
+
+    def retrieve(self, query: str, top_k: int = 10, score_function: str = "cos_sim") -> dict:
+        """Blocks until the batch containing this query is scored; returns {corpus_id: score}, best first."""
+        return self.submit(query, top_k, score_function).result()
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            first = self._queue.get()
+            if first is None:
+                break
+            batch = [first]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if request is None:
+                    stopping = True
+                    break
+                batch.append(request)
+            self._process(batch)
+        # 兜底：哨兵之后仍在队列里的请求不会再被处理，直接失败而不是让调用方永远阻塞
+        while True:
+            try:
+                request = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is not None:
+                request.future.set_exception(RuntimeError("RetrievalService is closed"))
+
+    def _process(self, batch: list[_Request]):
+        groups: dict[str, list[_Request]] = {}
+        for request in batch:
+            groups.setdefault(request.score_function, []).append(request)
+
+        for score_function, requests in groups.items():
+            # 相同 query 只编码一次（前端会对同一问题触发多次检索）
+            query_ids: dict[str, str] = {}
+            for request in requests:
+                query_ids.setdefault(request.query, f"q{len(query_ids)}")
+            queries = {qid: query for query, qid in query_ids.items()}
+
+            metrics.inc("service_batches")
+            metrics.inc("service_requests", len(requests))
+            try:
+                links = [request.span for request in requests if request.span is not None]
+                with metrics.span("retrieval_batch", links=links):
+                    results = self.searcher.search_index(
+                        queries,
+                        top_k=max(request.top_k for request in requests),
+                        score_function=score_function,
+                        return_sorted=True,
+                    )
+            except Exception as e:
+                for request in requests:
+                    request.future.set_exception(e)
+                continue
+
+            logger.debug(f"Scored {len(queries)} queries for {len(requests)} requests in one batch.")
+            for request in requests:
+                ranked = results[query_ids[request.query]]
+                request.future.set_result(dict(list(ranked.items())[: request.top_k]))
@@ -0,0 +1,318 @@
+"""
+Sharded exact search: the corpus embedding matrix is split row-wise across shard servers
+(local worker processes, or servers started on other hosts), each scoring its own rows.
+The coordinator scatters the query embeddings to every shard, gathers each shard's local
+top-k and merges them into the global top-k, so results are identical to DenseRetrievalExactSearch.
+
+Start a shard server by hand (e.g. on another node that can read the same embedding store):
+    RETRIEVER_SHARD_AUTHKEY=<secret> python -m retriever.sharded_search \\
+        --store ../cache/corpus_emb_<hash>.float32.emb --start 0 --end 500000 --host <private address> --port 7001
+
+Requests are pickled, so anyone holding the authkey can run code on a shard host: TCP shards
+and every shard in shard_addresses require an explicit RETRIEVER_SHARD_AUTHKEY (shared with the
+coordinator), and TCP shards should only be reachable from the coordinators' network. Shards
+spawned by the coordinator itself use a random per-process key.
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import multiprocessing as mp
+import os
+import shutil
+import tempfile
+import threading
+import weakref
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+import torch
+
+from retriever.embedding_store import EmbeddingStore
+from retriever.exact_search import CorpusIndex, DenseRetrievalExactSearch
+from retriever.util import merge_topk
+
+logger = logging.getLogger(__name__)
+
+AUTHKEY_ENV = "RETRIEVER_SHARD_AUTHKEY"
+
+
+def shard_authkey(authkey: bytes | None = None, address=None, remote: bool = False) -> bytes:
+    """
+    authkey, else $RETRIEVER_SHARD_AUTHKEY. A TCP address (or any remote shard, whose server
+    holds its own key) without either is refused, since the shard protocol unpickles requests;
+    a local unix socket shard gets a random key.
+    """
+    if authkey is None and os.environ.get(AUTHKEY_ENV):
+        authkey = os.environ[AUTHKEY_ENV].encode("utf-8")
+    if authkey is None:
+        if remote or isinstance(address, (tuple, list)):
+            raise ValueError(f"Shard {address} needs an explicit authkey: pass authkey or set {AUTHKEY_ENV}")
+        authkey = os.urandom(32)
+    return authkey
+
+
+def serve_shard(address, store_path: str, start: int, end: int, authkey: bytes | None = None,
+                score_block_size: int | None = None, num_threads: int | None = None, ready=None):
+    """
+    Holds rows [start, end) of the embedding store in memory and answers requests on address:
+        ("topk", query_embeddings, top_k, score_function) -> ("ok", values, global row indices)
+        ("info",) -> ("ok", {"start", "end", "store"})
+        ("close",) stops the server
+    Each coordinator connection is served on its own thread, so several coordinators can share a shard.
+    """
+    authkey = shard_authkey(authkey, address)
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    store = EmbeddingStore(store_path)
+    end = min(end, len(store))
+    index = CorpusIndex(list(range(start, end)), store.block(start, end), score_block_size=score_block_size)
+    info = {"start": start, "end": end, "store": os.path.basename(store_path)}
+    stop = threading.Event()
+
+    def accept_loop(listener):
+        while not stop.is_set():
+            try:
+                conn = listener.accept()
+            except AuthenticationError:
+                logger.warning("Rejected a shard connection with a wrong authkey")
+                continue
+            except (OSError, EOFError):
+                if stop.is_set():
+                    return
+                logger.exception("Shard accept failed")
+                continue
+            threading.Thread(target=_handle_connection, args=(conn, index, info, stop), daemon=True).start()
+
+    with Listener(address, authkey=authkey) as listener:
+        logger.info(f"Shard [{start}, {end}) listening on {listener.address}")
+        threading.Thread(target=accept_loop, args=(listener,), daemon=True).start()
+        if ready is not None:
+            ready.set()
+        stop.wait()
+
+
+def _handle_connection(conn, index: CorpusIndex, info: dict, stop: threading.Event):
+    """Serves one coordinator connection until it disconnects; a ("close",) request sets stop."""
+    with conn:
+        while not stop.is_set():
+            try:
+                request = conn.recv()
+            except (EOFError, OSError):
+                return
+            if _handle_request(conn, request, index, info):
+                stop.set()
+                return
+
+
+def _handle_request(conn, request, index: CorpusIndex, info: dict) -> bool:
+    """Answers one request; True if asked to stop."""
+    try:
+        if request[0] == "topk":
+            _, query_embeddings, top_k, score_function = request
+            values, idx = index.topk(torch.from_numpy(query_embeddings), top_k, score_function)
+            # 返回全局行号，协调端直接合并
+            idx = np.asarray(idx, dtype=np.int64) + info["start"]
+            conn.send(("ok", np.asarray(values, dtype=np.float32), idx))
+        elif request[0] == "info":
+            conn.send(("ok", info))
+        elif request[0] == "close":
+            conn.send(("ok", None))
+            return True
+        else:
+            conn.send(("error", f"unknown request {request[0]!r}"))
+    except Exception as e:
+        logger.exception("Shard request failed")
+        try:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+        except OSError:
+            pass
+    return False
+
+
+def _recv(conn, timeout: float | None):
+    if timeout is not None and not conn.poll(timeout):
+        raise TimeoutError(f"no reply within {timeout}s")
+    return conn.recv()
+
+
+def _close_connections(connections):
+    for conn in connections:
+        conn.close()
+
+
+def _shutdown(processes, connections, socket_dir):
+    for conn in connections:
+        try:
+            conn.send(("close",))
+            _recv(conn, 5.0)
+        except (OSError, EOFError, TimeoutError):
+            pass
+        conn.close()
+    for process in processes:
+        process.join(timeout=5)
+        if process.is_alive():
+            process.terminate()
+    if socket_dir:
+        shutil.rmtree(socket_dir, ignore_errors=True)
+
+
+class ShardedSearch(DenseRetrievalExactSearch):
+    """
+    DenseRetrievalExactSearch whose scoring is spread over n_shards shard servers.
+
+    By default the shards are spawned as local worker processes reached over unix sockets.
+    With shard_addresses, already running servers (see serve_shard / the module CLI) are used
+    instead; together they must cover every row of this corpus's embedding store, and they must
+    share authkey (default: $RETRIEVER_SHARD_AUTHKEY).
+
+    A shard that fails or does not reply within timeout seconds drops every shard connection
+    (and stops local shards); call build_index again to reconnect.
+    """
+
+    def __init__(self, model, n_shards: int = 2, shard_addresses: list | None = None,
+                 authkey: bytes | None = None, threads_per_shard: int | None = None,
+                 timeout: float | None = 60.0, **kwargs):
+        super().__init__(model, **kwargs)
+        self.n_shards = len(shard_addresses) if shard_addresses else n_shards
+        self.shard_addresses = shard_addresses
+        if shard_addresses:
+            # 远程分片的 key 由服务端决定，随机生成的 key 永远无法通过认证
+            for address in shard_addresses:
+                authkey = shard_authkey(authkey, address, remote=True)
+        self.authkey = authkey
+        self.timeout = timeout
+        self.threads_per_shard = threads_per_shard or max(1, (os.cpu_count() or 1) // self.n_shards)
+        self._connections = []
+        self._finalizer = None
+        # 一次 scatter-gather 独占所有连接
+        self._lock = threading.Lock()
+
+    def build_index(self, corpus):
+        index = super().build_index(corpus)
+        self.close()
+        # 量化存储时，分片用 float32 副本打分，结果与精确检索一致
+        store_path = self._corpus_cache_path(index.corpus_hash, "float32")
+        if not os.path.exists(store_path):
+            store_path = self._corpus_cache_path(index.corpus_hash)
+        if self.shard_addresses:
+            self._connect_remote(store_path, len(index))
+        else:
+            self._start_local(store_path, len(index))
+        return index
+
+    def _start_local(self, store_path: str, n_rows: int):
+        ctx = mp.get_context("spawn")
+        authkey = shard_authkey(self.authkey)
+        socket_dir = tempfile.mkdtemp(prefix="retriever_shards_")
+        bounds = np.linspace(0, n_rows, self.n_shards + 1).astype(int)
+        processes, events, addresses = [], [], []
+        for i in range(self.n_shards):
+            address = os.path.join(socket_dir, f"shard{i}.sock")
+            ready = ctx.Event()
+            process = ctx.Process(
+                target=serve_shard,
+                args=(address, store_path, int(bounds[i]), int(bounds[i + 1]), authkey,
+                      self.score_block_size, self.threads_per_shard, ready),
+                name=f"retriever-shard-{i}",
+                daemon=True,
+            )
+            process.start()
+            processes.append(process)
+            events.append(ready)
+            addresses.append(address)
+
+        logger.info(f"Starting {self.n_shards} shard workers ({self.threads_per_shard} threads each)...")
+        for process, ready in zip(processes, events):
+            while not ready.wait(timeout=1.0):
+                if not process.is_alive():
+                    _shutdown(processes, [], socket_dir)
+                    raise RuntimeError(f"{process.name} exited with code {process.exitcode} during startup")
+        self._connections = [Client(address, authkey=authkey) for address in addresses]
+        self._finalizer = weakref.finalize(self, _shutdown, processes, self._connections, socket_dir)
+
+    def _connect_remote(self, store_path: str, n_rows: int):
+        connections = []
+        try:
+            covered = []
+            for address in self.shard_addresses:
+                conn = Client(tuple(address) if isinstance(address, list) else address, authkey=self.authkey)
+                connections.append(conn)
+                conn.send(("info",))
+                _, info = _recv(conn, self.timeout)
+                if info["store"] != os.path.basename(store_path):
+                    raise RuntimeError(f"Shard {address} serves {info['store']}, expected {os.path.basename(store_path)}")
+                covered.append((info["start"], info["end"]))
+            covered.sort()
+            expected = 0
+            for start, end in covered:
+                if start != expected:
+                    raise RuntimeError(f"Shards do not cover rows [0, {n_rows}) contiguously: {covered}")
+                expected = end
+            if expected != n_rows:
+                raise RuntimeError(f"Shards cover {expected} of {n_rows} rows: {covered}")
+        except BaseException:
+            _close_connections(connections)
+            raise
+        self._connections = connections
+        self._finalizer = weakref.finalize(self, _close_connections, connections)
+
+    def _topk(self, query_embeddings: torch.Tensor, top_k: int, score_function: str, return_sorted: bool):
+        if not self._connections:
+            raise RuntimeError("Shards not started. Call build_index(corpus) first.")
+        queries = torch.as_tensor(query_embeddings).float().cpu()
+        if len(queries.shape) == 1:
+            queries = queries.unsqueeze(0)
+        queries = queries.numpy()
+
+        best_values, best_idx = None, None
+        with self._lock:
+            try:
+                # 先发给所有分片再依次收结果，各分片并行打分
+                for conn in self._connections:
+                    conn.send(("topk", queries, top_k, score_function))
+                replies = [_recv(conn, self.timeout) for conn in self._connections]
+            except (OSError, EOFError, TimeoutError) as e:
+                # 其余分片的回复还留在连接里，继续用会把上一次的结果当成下一次的：全部断开
+                self.close()
+                raise RuntimeError(f"Shard connection lost ({type(e).__name__}: {e}); call build_index to restart the shards") from e
+        for status, *payload in replies:
+            if status != "ok":
+                raise RuntimeError(f"Shard search failed: {payload[0]}")
+            values, idx = payload
+            best_values, best_idx = merge_topk(best_values, best_idx, torch.from_numpy(values), torch.from_numpy(idx), top_k)
+
+        if return_sorted:
+            best_values, pos = torch.sort(best_values, dim=1, descending=True)
+            best_idx = torch.gather(best_idx, 1, pos)
+        return best_values.tolist(), best_idx.tolist()
+
+    def close(self):
+        if self._finalizer is not None:
+            self._finalizer()
+            self._finalizer = None
+        self._connections = []
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve one shard of a corpus embedding store.")
+    parser.add_argument("--store", required=True, help="corpus_emb_<hash>.<dtype>.emb file")
+    parser.add_argument("--start", type=int, required=True)
+    parser.add_argument("--end", type=int, required=True)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7001)
+    parser.add_argument("--score-block-size", type=int, default=None)
+    parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    if not os.environ.get(AUTHKEY_ENV):
+        parser.error(f"set {AUTHKEY_ENV} to the key shared with the coordinator")
+    print(f"✅ Serving rows [{args.start}, {args.end}) of {args.store} on {args.host}:{args.port}")
+    serve_shard((args.host, args.port), args.store, args.start, args.end,
+                score_block_size=args.score_block_size, num_threads=args.threads)
+
+
+if __name__ == "__main__":
+    main()
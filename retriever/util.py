@@ -45,4 +45,68 @@ def dot_score(a: torch.Tensor, b: torch.Tensor):
     if len(b.shape) == 1:
         b = b.unsqueeze(0)
 
-    return torch.mm(a, b.transpose(0, 1))
\ No newline at end of file
+    return torch.mm(a, b.transpose(0, 1))
+
+def merge_topk(best_values, best_idx, values: torch.Tensor, idx: torch.Tensor, top_k: int):
+    """
+    Merges a block's candidate (values, idx) into the running per-query top-k.
+    best_values / best_idx may be None for the first block.
+    """
+    if best_values is not None:
+        values = torch.cat([best_values, values], dim=1)
+        idx = torch.cat([best_idx, idx], dim=1)
+    if values.size(1) > top_k:
+        values, pos = torch.topk(values, top_k, dim=1, largest=True, sorted=False)
+        idx = torch.gather(idx, 1, pos)
+    return values, idx
+
+
+def topk_blockwise(
+    a: torch.Tensor,
+    b: torch.Tensor,
+    top_k: int,
+    score_function=cos_sim,
+    block_size: int = 65536,
+    sorted: bool = True,
+):
+    """
+    Computes top_k of score_function(a[i], b[j]) over j without building the full |a| x |b| matrix.
+    b is walked in blocks of block_size rows and only a running per-query top-k is kept,
+    so peak memory is O(|a| * (block_size + top_k)).
+    :return: (values, indices) tensors of shape (|a|, min(top_k, |b|))
+    """
+    if not isinstance(a, torch.Tensor):
+        a = torch.tensor(a)
+
+    if not isinstance(b, torch.Tensor):
+        b = torch.tensor(b)
+
+    if len(a.shape) == 1:
+        a = a.unsqueeze(0)
+
+    if len(b.shape) == 1:
+        b = b.unsqueeze(0)
+
+    if score_function is cos_sim:
+        # normalize queries once instead of once per block
+        a = torch.nn.functional.normalize(a, p=2, dim=1)
+
+    top_k = min(top_k, b.size(0))
+    best_values = None
+    best_idx = None
+    for start in range(0, b.size(0), block_size):
+        block = b[start:start + block_size]
+        if score_function is cos_sim:
+            scores = dot_score(a, torch.nn.functional.normalize(block, p=2, dim=1))
+        else:
+            scores = score_function(a, block)
+        scores[torch.isnan(scores)] = -1
+
+        values, idx = torch.topk(scores, min(top_k, scores.size(1)), dim=1, largest=True, sorted=False)
+        best_values, best_idx = merge_topk(best_values, best_idx, values, idx + start, top_k)
+        del scores
+
+    if sorted:
+        best_values, order = torch.sort(best_values, dim=1, descending=True)
+        best_idx = torch.gather(best_idx, 1, order)
+    return best_values, best_idx
@@ -0,0 +1,301 @@
+import asyncio
+import json
+import os
+import random
+import time
+from collections import deque, namedtuple
+from urllib.parse import urldefrag, urlsplit
+
+import aiohttp
+
+# 这些状态码视为暂时性错误，可以重试
+RETRY_STATUS = {408, 425, 429, 500, 502, 503, 504}
+# 已抓取过的页面返回这些状态码时视为已删除
+GONE_STATUS = {404, 410}
+
+FetchResult = namedtuple("FetchResult", ["url", "status", "content", "headers"])
+
+
+class CrawlError(Exception):
+    pass
+
+
+def canonical_url(url):
+    """Drops the #fragment so the same page is only crawled once."""
+    return urldefrag(url)[0]
+
+
+class HostRateLimiter:
+    """Spaces requests to the same host at least 1 / rate seconds apart (rate <= 0: unlimited)."""
+
+    def __init__(self, rate=2.0):
+        self.interval = 1.0 / rate if rate and rate > 0 else 0.0
+        self._next = {}
+
+    async def wait(self, host):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        slot = max(now, self._next.get(host, now))
+        self._next[host] = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class Frontier:
+    """FIFO of URLs to crawl; every canonical URL is only ever enqueued once."""
+
+    def __init__(self, seen=()):
+        self.queue = deque()
+        self.seen = set(seen)
+
+    def __len__(self):
+        return len(self.queue)
+
+    def add(self, url):
+        url = canonical_url(url)
+        if url in self.seen:
+            return False
+        self.seen.add(url)
+        self.queue.append(url)
+        return True
+
+    def pop(self):
+        return self.queue.popleft()
+
+
+class Checkpoint:
+    """
+    Crawl progress on disk: URLs done, still pending (queued or in flight) and failed.
+    A resumed crawl skips done URLs and retries pending and failed ones; a crawl that
+    finishes with nothing pending or failed clears it, so the next run starts fresh.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        self.pending = []
+        self.failed = {}
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            self.done = set(state.get('done', []))
+            self.pending = state.get('pending', [])
+            self.failed = state.get('failed', {})
+
+    def save(self, pending):
+        if not self.path:
+            return
+        state = {'done': sorted(self.done), 'pending': list(pending), 'failed': self.failed}
+        # 先写临时文件再替换，中途被杀也不会留下半个 checkpoint
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        self.done = set()
+        self.pending = []
+        self.failed = {}
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class AsyncCrawler:
+    """
+    Concurrent crawler: a bounded pool of workers pulls URLs from a deduplicating frontier,
+    fetches them over one pooled aiohttp session with per-host rate limiting, a per-request
+    timeout and retry with exponential backoff, and hands each page to a handler.
+    Progress is checkpointed every checkpoint_every pages so an interrupted crawl can resume.
+
+    With a FetchStore, requests are conditional and pages that come back 304 or with the same
+    body hash skip the handler (their links are followed from the stored outlinks); self.changes then lists the added / updated / unchanged / deleted
+    URLs of the run (prune_missing=True also counts stored URLs not crawled this time as deleted).
+    """
+
+    def __init__(
+        self,
+        concurrency=8,
+        per_host_rate=2.0,
+        max_retries=3,
+        backoff=0.5,
+        timeout=30.0,
+        headers=None,
+        checkpoint_path=None,
+        checkpoint_every=100,
+        max_pages=None,
+        fetch_store=None,
+        prune_missing=False,
+    ):
+        self.concurrency = concurrency
+        self.rate_limiter = HostRateLimiter(per_host_rate)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.headers = headers or {}
+        self.checkpoint = Checkpoint(checkpoint_path)
+        self.checkpoint_every = checkpoint_every
+        self.max_pages = max_pages
+        self.fetch_store = fetch_store
+        self.prune_missing = prune_missing
+        self.stats = {'fetched': 0, 'failed': 0, 'retries': 0, 'bytes': 0}
+        self.changes = {'added': [], 'updated': [], 'unchanged': [], 'deleted': []}
+
+    async def _sleep_before_retry(self, attempt, retry_after=None):
+        self.stats['retries'] += 1
+        delay = self.backoff * (2 ** attempt) * (1 + random.random() * 0.1)
+        if retry_after is not None:
+            try:
+                delay = max(delay, float(retry_after))
+            except ValueError:
+                pass
+        await asyncio.sleep(delay)
+
+    async def fetch(self, session, url, headers=None):
+        """
+        GETs url with rate limiting and retries.
+
+        Returns:
+            FetchResult: status, body and response headers; 4xx (other than 408/425/429) is returned, not retried
+        """
+        host = urlsplit(url).netloc
+        for attempt in range(self.max_retries + 1):
+            await self.rate_limiter.wait(host)
+            try:
+                async with session.get(url, headers=headers) as response:
+                    if response.status in RETRY_STATUS and attempt < self.max_retries:
+                        await self._sleep_before_retry(attempt, response.headers.get('Retry-After'))
+                        continue
+                    content = await response.read()
+                    self.stats['bytes'] += len(content)
+                    return FetchResult(str(response.url), response.status, content, dict(response.headers))
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt >= self.max_retries:
+                    raise CrawlError(f"{type(e).__name__}: {e}") from e
+                await self._sleep_before_retry(attempt)
+        raise CrawlError(f"{url} failed after {self.max_retries} retries")
+
+    async def crawl(self, urls, handler, extract_links=None):
+        """
+        Crawls urls (and, if extract_links is given, the links it returns for each page).
+
+        Args:
+            urls (iterable): seed URLs
+            handler (callable): handler(url, fetch_result) -> data for each successful (2xx) page that is
+                new or changed; it runs in a worker thread so parsing does not stall other fetches, and it
+                should persist its own output (thread-safely) for resumable crawls
+            extract_links (callable, optional): extract_links(url, fetch_result) -> iterable of URLs to enqueue,
+                also run in a worker thread
+
+        Returns:
+            dict: {url: data} for the pages handled in this run
+        """
+        checkpoint = self.checkpoint
+        frontier = Frontier(seen=checkpoint.done)
+        for url in list(checkpoint.pending) + list(checkpoint.failed) + list(urls):
+            frontier.add(url)
+        checkpoint.failed = {}
+        if checkpoint.done:
+            print(f"Resuming crawl: {len(checkpoint.done)} done, {len(frontier)} pending")
+
+        results = {}
+        in_flight = set()
+        wakeup = asyncio.Condition()
+        handled = 0
+        completed = 0
+
+        async def worker(session):
+            nonlocal handled, completed
+            while True:
+                async with wakeup:
+                    # 队列空但还有请求在途时，它们可能会加入新链接，所以等待而不是退出
+                    while not frontier.queue and in_flight:
+                        await wakeup.wait()
+                    if not frontier.queue or (self.max_pages is not None and handled >= self.max_pages):
+                        wakeup.notify_all()
+                        return
+                    url = frontier.pop()
+                    in_flight.add(url)
+                    handled += 1
+                try:
+                    await self._process(session, url, handler, extract_links, frontier, results)
+                    checkpoint.done.add(url)
+                except Exception as e:
+                    self.stats['failed'] += 1
+                    checkpoint.failed[url] = str(e)
+                    print(f"Error crawling {url}: {e}")
+                async with wakeup:
+                    in_flight.discard(url)
+                    # 按完成的页面数而不是出队数计，保证每 checkpoint_every 个完成的页面写一次
+                    completed += 1
+                    if completed % self.checkpoint_every == 0:
+                        self._save_progress(list(in_flight) + list(frontier.queue))
+                    wakeup.notify_all()
+
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        start_time = time.perf_counter()
+        try:
+            async with aiohttp.ClientSession(connector=connector, timeout=timeout, headers=self.headers) as session:
+                await asyncio.gather(*(worker(session) for _ in range(self.concurrency)))
+        finally:
+            finished = not frontier.queue and not in_flight
+            if self.fetch_store is not None and self.prune_missing and finished:
+                self.changes['deleted'].extend(self.fetch_store.prune(frontier.seen))
+            if finished and not checkpoint.failed:
+                # 完整跑完：删除 checkpoint，否则下次运行会把所有 URL 当作已完成而什么都不抓
+                checkpoint.clear()
+                if self.fetch_store is not None:
+                    self.fetch_store.save()
+            else:
+                # 被取消或出错时同样写 checkpoint，在途 URL 记为 pending
+                self._save_progress(list(in_flight) + list(frontier.queue))
+
+        elapsed = time.perf_counter() - start_time
+        print(
+            f"Crawled {self.stats['fetched']} pages ({self.stats['failed']} failed, {self.stats['retries']} retries) "
+            f"in {elapsed:.1f}s ({self.stats['fetched'] / max(elapsed, 1e-9):.1f} pages/sec)"
+        )
+        if self.fetch_store is not None:
+            print(
+                f"Changes: {len(self.changes['added'])} added, {len(self.changes['updated'])} updated, "
+                f"{len(self.changes['unchanged'])} unchanged, {len(self.changes['deleted'])} deleted"
+            )
+        return results
+
+    async def _process(self, session, url, handler, extract_links, frontier, results):
+        store = self.fetch_store
+        headers = store.conditional_headers(url) if store is not None else None
+        result = await self.fetch(session, url, headers=headers)
+        if store is not None and result.status in GONE_STATUS and store.remove(url):
+            self.changes['deleted'].append(url)
+            return
+        if result.status >= 400:
+            raise CrawlError(f"HTTP {result.status}")
+        self.stats['fetched'] += 1
+
+        change = store.classify(url, result) if store is not None else 'added'
+        links = None
+        if change == 'unchanged':
+            # 304 或内容 hash 未变：不解析、不保存，只刷新校验信息；沿上次记下的出链继续抓取
+            if extract_links is not None:
+                links = store.links(url)
+        else:
+            # 解析是 CPU 密集的同步代码，放到线程池里执行，避免阻塞其他抓取
+            loop = asyncio.get_running_loop()
+            results[url] = await loop.run_in_executor(None, handler, url, result)
+            if extract_links is not None:
+                links = await loop.run_in_executor(None, lambda: list(extract_links(url, result)))
+        for link in links or ():
+            frontier.add(link)
+        if store is not None:
+            if change != 'unchanged' and results[url] is None:
+                # 抽取失败：不记录新 hash，下次仍会被当作有变化重新解析
+                return
+            store.record(url, result, links=links)
+            self.changes[change].append(url)
+
+    def _save_progress(self, pending):
+        self.checkpoint.save(pending)
+        if self.fetch_store is not None:
+            self.fetch_store.save()
@@ -0,0 +1,112 @@
+import hashlib
+import json
+import os
+import time
+
+
+def body_hash(content):
+    return hashlib.sha1(content).hexdigest()
+
+
+class FetchStore:
+    """
+    Per-URL fetch metadata kept between crawl runs: ETag, Last-Modified, the sha1 of the body
+    and, for link-following crawls, the page's outlinks.
+
+    Used to send conditional requests (If-None-Match / If-Modified-Since) and to tell
+    added / updated / unchanged pages apart, so unchanged pages are neither parsed nor saved again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, url):
+        return url in self.entries
+
+    def conditional_headers(self, url):
+        entry = self.entries.get(url)
+        if entry is None:
+            return None
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers or None
+
+    def classify(self, url, result):
+        """
+        Returns:
+            str: 'unchanged' (304 or same body hash), 'updated' or 'added'
+        """
+        entry = self.entries.get(url)
+        if entry is None:
+            return 'added'
+        if result.status == 304 or entry.get('sha1') == body_hash(result.content):
+            return 'unchanged'
+        return 'updated'
+
+    def links(self, url):
+        """Outlinks recorded for url on the last crawl that parsed it."""
+        return self.entries.get(url, {}).get('links', [])
+
+    def record(self, url, result, links=None):
+        """
+        Stores the validators of a fetched page; a 304 keeps the stored hash and only refreshes the validators.
+        links, if given, are kept so a later crawl can follow them without re-parsing an unchanged page.
+        """
+        entry = self.entries.setdefault(url, {})
+        # 304 响应可能带新的 ETag；没有就沿用旧的
+        entry['etag'] = result.headers.get('ETag', entry.get('etag'))
+        entry['last_modified'] = result.headers.get('Last-Modified', entry.get('last_modified'))
+        if result.status != 304:
+            entry['sha1'] = body_hash(result.content)
+        if links is not None:
+            entry['links'] = list(links)
+        entry['fetched_at'] = time.time()
+
+    def remove(self, url):
+        return self.entries.pop(url, None) is not None
+
+    def prune(self, keep_urls):
+        """Drops every URL not in keep_urls; returns the dropped URLs."""
+        removed = [url for url in self.entries if url not in keep_urls]
+        for url in removed:
+            del self.entries[url]
+        return removed
+
+    def save(self):
+        if not self.path:
+            return
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
+def write_change_manifest(path, changes):
+    """
+    Writes the added / updated / deleted URLs of one crawl run (and the number unchanged) as JSON,
+    so later pipeline stages only process the delta.
+    """
+    manifest = {
+        'generated_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'added': sorted(changes['added']),
+        'updated': sorted(changes['updated']),
+        'deleted': sorted(changes['deleted']),
+        'unchanged': len(changes['unchanged']),
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    print(
+        f"Change manifest written to {path}: {len(manifest['added'])} added, {len(manifest['updated'])} updated, "
+        f"{len(manifest['deleted'])} deleted, {manifest['unchanged']} unchanged"
+    )
+    return manifest
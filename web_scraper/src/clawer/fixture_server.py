@@ -0,0 +1,122 @@
+"""
+Local stand-in for Wikipedia, for trying the crawler without hitting the real site.
+GET /wiki/<Page_Name> returns a generated article page (same layout as en.wikipedia.org:
+h1#firstHeading plus <p> paragraphs inside #mw-content-text), with an ETag and Last-Modified
+that change when the page's version in handler.versions is bumped; conditional requests get 304.
+
+    python web_scraper/src/clawer/fixture_server.py --port 8002
+"""
+import argparse
+import hashlib
+import random
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+WORDS = (
+    "data web page article crawler index search query model vector corpus token history science "
+    "network system language city river music theory study research company university century"
+).split()
+
+
+def fixture_page(page_name, paragraphs=20, words_per_paragraph=80, version=0):
+    """Deterministic article HTML for (page_name, version)."""
+    rng = random.Random(f"{page_name}:{version}")
+    title = page_name.replace("_", " ")
+    body = "\n".join(
+        "<p>" + " ".join(rng.choice(WORDS) for _ in range(words_per_paragraph)) + f" <a href=\"/wiki/{rng.choice(WORDS).title()}\">link</a>.</p>"
+        for _ in range(paragraphs)
+    )
+    # 带上导航、侧栏等噪声，接近真实页面的结构
+    return f"""<!DOCTYPE html>
+<html lang="en"><head><meta charset="UTF-8"><title>{title} - Wikipedia</title>
+<script>var config = {{"page": "{page_name}"}};</script></head>
+<body>
+<div id="mw-navigation"><ul>{"".join(f'<li><a href="/wiki/Nav_{i}">Nav {i}</a></li>' for i in range(30))}</ul></div>
+<div id="content">
+<h1 id="firstHeading" class="firstHeading mw-first-heading"><span class="mw-page-title-main">{title}</span></h1>
+<div id="mw-content-text"><div class="mw-parser-output">
+<table class="infobox"><tr><th>{title}</th></tr><tr><td>infobox</td></tr></table>
+{body}
+</div></div></div>
+<div id="footer"><p>Text is available under the Creative Commons License.</p></div>
+</body></html>""".encode("utf-8")
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    # 由 serve() 设置
+    paragraphs = 20
+    delay = 0.0
+    fail_first = 0
+    validators = True
+    requests_seen = 0
+    # page_name -> 版本号，修改后页面内容与 ETag 随之改变；deleted 中的页面返回 404
+    versions = {}
+    deleted = set()
+    lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        with self.lock:
+            type(self).requests_seen += 1
+            n = type(self).requests_seen
+        if n <= self.fail_first:
+            self.send_error(503, "fixture overloaded")
+            return
+        if not self.path.startswith("/wiki/"):
+            self.send_error(404)
+            return
+        time.sleep(self.delay)
+
+        page_name = unquote(self.path[len("/wiki/"):].split("?")[0])
+        if page_name.startswith("Missing") or page_name in self.deleted:
+            self.send_error(404)
+            return
+        version = self.versions.get(page_name, 0)
+        body = fixture_page(page_name, self.paragraphs, version=version)
+        etag = '"' + hashlib.sha1(body).hexdigest()[:16] + '"'
+        if self.validators and self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=UTF-8")
+        self.send_header("Content-Length", str(len(body)))
+        if self.validators:
+            self.send_header("ETag", etag)
+            self.send_header("Last-Modified", formatdate(1700000000 + version * 86400, usegmt=True))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve(host="127.0.0.1", port=0, paragraphs=20, delay=0.0, fail_first=0, validators=True):
+    """
+    Starts the fixture server on a background thread; returns (server, base_url).
+    server.RequestHandlerClass.versions / .deleted can be edited to simulate page edits and deletions.
+    """
+    handler = type("Handler", (FixtureHandler,), {
+        "paragraphs": paragraphs, "delay": delay, "fail_first": fail_first, "validators": validators,
+        "requests_seen": 0, "versions": {}, "deleted": set(),
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8002)
+    parser.add_argument("--paragraphs", type=int, default=20)
+    parser.add_argument("--delay", type=float, default=0.05)
+    args = parser.parse_args()
+    server, base_url = serve(port=args.port, paragraphs=args.paragraphs, delay=args.delay)
+    print(f"Fixture wiki listening on {base_url}/wiki/<Page_Name>")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
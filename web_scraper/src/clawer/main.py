@@ -1,10 +1,22 @@
 import requests
 from bs4 import BeautifulSoup
+import asyncio
 import json
+import os
+import sys
+import threading
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from crawler import AsyncCrawler
+from fetch_store import FetchStore, write_change_manifest
+from shards import ShardWriter
+import parsers
 
 class BaseScraper:
-    def __init__(self, base_url):
+    def __init__(self, base_url, parser=None):
         self.base_url = base_url
+        # BeautifulSoup 解析器：默认用 C 实现的 lxml（已安装时），否则 html.parser
+        self.parser = parser or parsers.default_parser()
         self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
@@ -40,11 +52,51 @@ class BaseScraper:
             _type_: _description_
         """
         try:
-            return BeautifulSoup(html_content, 'html.parser')
+            return BeautifulSoup(html_content, self.parser)
         except Exception as e:
             print(f"Error parsing HTML content: {e}")
             return None
 
+    def crawl(self, urls, extract, fetch_store_path=None, manifest_path=None, writer=None, doc_type=None, **crawler_kwargs):
+        """_summary_: Fetch and extract many pages concurrently
+
+        Args:
+            urls (list): urls of the pages
+            extract (callable): extract(html_content, url) -> data, or None if the page has no usable data
+            fetch_store_path (string, optional): ETag / Last-Modified / body hash store; when set, unchanged
+                pages are not re-downloaded (304) or not re-parsed (same hash) and are left out of the result
+            manifest_path (string, optional): where to write the added / updated / deleted change manifest
+            writer (ShardWriter, optional): every extracted page is appended to it as soon as it is parsed
+                (keyed by url), and pages found deleted are marked deleted
+            doc_type (string, optional): record type written with each page, as in save_to_json
+            **crawler_kwargs: AsyncCrawler options (concurrency, per_host_rate, max_retries, checkpoint_path, ...)
+
+        Returns:
+            dict: {url: data} for the pages fetched and extracted successfully
+        """
+        # aiohttp 自己协商压缩格式（不一定支持 br），其余请求头沿用 requests session
+        headers = {k: v for k, v in self.session.headers.items() if k != 'Accept-Encoding'}
+        fetch_store = FetchStore(fetch_store_path) if fetch_store_path else None
+        crawler = AsyncCrawler(headers=headers, fetch_store=fetch_store, **crawler_kwargs)
+        # handle 在爬虫的线程池里并发执行，写 shard 需要串行
+        write_lock = threading.Lock()
+
+        def handle(url, result):
+            data = extract(result.content, url)
+            if writer is not None and data is not None:
+                with write_lock:
+                    self.save_to_shards(data, writer, doc_type, key=url)
+            return data
+
+        results = asyncio.run(crawler.crawl(urls, handle))
+        self.last_changes = crawler.changes
+        if writer is not None:
+            for url in crawler.changes['deleted']:
+                writer.delete(url)
+        if manifest_path and fetch_store is not None:
+            write_change_manifest(manifest_path, crawler.changes)
+        return {url: data for url, data in results.items() if data is not None}
+
     def save_to_json(self, data, filename, doc_type):
         try:
             structured_data = {
@@ -57,16 +109,48 @@ class BaseScraper:
         except Exception as e:
             print(f"Error saving data to {filename}: {e}")
 
+    def open_shards(self, directory, prefix, max_bytes=64 * 2**20, compress=None):
+        """_summary_: Open append-only JSONL shards (see shards.py) for save_to_shards"""
+        return ShardWriter(directory, prefix=prefix, max_bytes=max_bytes, compress=compress)
+
+    def save_to_shards(self, data, writer, doc_type, key=None):
+        """_summary_: Append one record, structured as in save_to_json, to a ShardWriter"""
+        try:
+            writer.append({'type': doc_type, 'data': data}, key=key)
+        except Exception as e:
+            print(f"Error saving data to {writer.path}: {e}")
+
 class WikipediaScraper(BaseScraper):
-    def __init__(self):
-        super().__init__('https://en.wikipedia.org')
+    def __init__(self, parser=None, extractor=None):
+        super().__init__('https://en.wikipedia.org', parser)
+        # 文章抽取方式：'lxml-stream' / 'selectolax' 不建整棵树，'bs4' 用 parse_html
+        self.extractor = extractor or parsers.default_extractor()
+        extractors = parsers.available_extractors()
+        if self.extractor not in extractors:
+            raise ValueError(f"extractor: {self.extractor} must be one of {list(extractors)}")
+        self._extract_article = extractors[self.extractor]
+
+    def page_url(self, page_name):
+        return f'{self.base_url}/wiki/{page_name}'
 
     def scrape_page(self, page_name):
-        url = f'{self.base_url}/wiki/{page_name}'
+        url = self.page_url(page_name)
         html_content = self.fetch_content(url)
         if html_content is None:
             return None
-        
+        return self.extract_page(html_content, url)
+
+    def extract_page(self, html_content, url=None):
+        if self.extractor != 'bs4':
+            try:
+                data = self._extract_article(html_content)
+            except Exception as e:
+                print(f"Error parsing HTML content: {e}")
+                return None
+            if data is None:
+                print(f"Error extracting data from {url}: no firstHeading")
+            return data
+
         soup = self.parse_html(html_content)
         if soup is None:
             return None
@@ -84,16 +168,44 @@ class WikipediaScraper(BaseScraper):
             print(f"Error extracting data from {url}: {e}")
             return None
 
+    def scrape_pages(self, page_names, **crawler_kwargs):
+        """_summary_: Scrape many wiki pages concurrently (see BaseScraper.crawl)
+
+        Returns:
+            dict: {page_name: data} for the pages scraped successfully
+        """
+        urls = {self.page_url(name): name for name in page_names}
+        crawler_kwargs.setdefault('doc_type', 'knowledge article')
+        results = self.crawl(list(urls), self.extract_page, **crawler_kwargs)
+        # 恢复的 checkpoint 里可能有不在本次列表中的 URL：它们已写入 shard，这里只返回请求的页面
+        return {urls[url]: data for url, data in results.items() if url in urls}
+
 class IndeedScraper(BaseScraper):
-    def __init__(self):
-        super().__init__('https://www.indeed.com')
+    def __init__(self, parser=None):
+        super().__init__('https://www.indeed.com', parser)
+
+    def jobs_url(self, query):
+        return f'{self.base_url}/jobs?q={query}'
 
     def scrape_jobs(self, query):
-        url = f'{self.base_url}/jobs?q={query}'
+        url = self.jobs_url(query)
         html_content = self.fetch_content(url)
         if html_content is None:
             return None
-        
+        return self.extract_jobs(html_content, url)
+
+    def scrape_jobs_many(self, queries, **crawler_kwargs):
+        """_summary_: Scrape job titles for many queries concurrently (see BaseScraper.crawl)
+
+        Returns:
+            dict: {query: job_titles} for the queries scraped successfully
+        """
+        urls = {self.jobs_url(query): query for query in queries}
+        crawler_kwargs.setdefault('doc_type', 'job description')
+        results = self.crawl(list(urls), self.extract_jobs, **crawler_kwargs)
+        return {urls[url]: data for url, data in results.items() if url in urls}
+
+    def extract_jobs(self, html_content, url=None):
         soup = self.parse_html(html_content)
         if soup is None:
             return None
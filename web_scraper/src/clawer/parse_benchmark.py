@@ -0,0 +1,73 @@
+"""
+Parse throughput of the article extractors in parsers.py against the original
+BeautifulSoup(html, 'html.parser') path, on fixture pages (fixture_server.fixture_page)
+or on saved HTML files. Checks every extractor returns the same data as the original path.
+
+    python web_scraper/src/clawer/parse_benchmark.py --pages 200 --paragraphs 150
+    python web_scraper/src/clawer/parse_benchmark.py --html saved_pages/*.html
+"""
+import argparse
+import json
+import time
+
+import parsers
+from fixture_server import fixture_page
+
+
+def bench(extract, pages, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for html in pages:
+            extract(html)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', type=int, default=100, help='number of fixture pages')
+    parser.add_argument('--paragraphs', type=int, default=150, help='paragraphs per fixture page')
+    parser.add_argument('--html', nargs='*', help='saved HTML pages to use instead of fixtures')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    args = parser.parse_args(argv)
+
+    if args.html:
+        pages = []
+        for path in args.html:
+            with open(path, 'rb') as f:
+                pages.append(f.read())
+    else:
+        pages = [fixture_page(f'Page_{i}', args.paragraphs) for i in range(args.pages)]
+    total_mb = sum(len(html) for html in pages) / 2**20
+
+    extractors = parsers.available_extractors()
+    reference = [extractors['bs4'](html) for html in pages]
+    baseline = None
+    report = []
+    for name, extract in extractors.items():
+        matches = sum(extract(html) == ref for html, ref in zip(pages, reference))
+        seconds = bench(extract, pages, args.repeat)
+        if baseline is None:
+            baseline = seconds
+        report.append({
+            'extractor': name,
+            'pages_per_sec': len(pages) / seconds,
+            'mb_per_sec': total_mb / seconds,
+            'speedup': baseline / seconds,
+            'matches_bs4': f'{matches}/{len(pages)}',
+        })
+        print(f"{name:12s} {len(pages) / seconds:8.1f} pages/sec  {baseline / seconds:5.1f}x  matches {matches}/{len(pages)}")
+
+    output = json.dumps({'pages': len(pages), 'mb': total_mb, 'extractors': report}, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+        print(f"Benchmark report written to {args.output}")
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
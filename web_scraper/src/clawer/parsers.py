@@ -0,0 +1,128 @@
+"""
+HTML parser backends for the scrapers.
+
+Full-tree parsing goes through BeautifulSoup with a selectable parser ("html.parser", or the
+C-backed "lxml" when installed). Article extraction (the firstHeading title plus the <p>
+paragraphs) can skip the tree entirely:
+
+    "lxml-stream"  lxml's HTML parser driven with a SAX-style target: no element is ever built,
+                   only the text inside <h1> and <p> is collected
+    "selectolax"   selectolax (lexbor) CSS selection, if installed
+    "bs4"          BeautifulSoup with the scraper's parser (the original path)
+
+All extractors return the same {'title', 'paragraphs'} dict, or None if the page has no firstHeading.
+"""
+from bs4 import BeautifulSoup
+
+try:
+    from lxml import etree
+except ImportError:  # lxml 可选，没有时退回 html.parser
+    etree = None
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+
+def default_parser():
+    """Fastest BeautifulSoup parser available."""
+    return 'lxml' if etree is not None else 'html.parser'
+
+
+def extract_article_bs4(html_content, parser='html.parser'):
+    soup = BeautifulSoup(html_content, parser)
+    heading = soup.find('h1', id='firstHeading')
+    if heading is None:
+        return None
+    return {
+        'title': heading.text,
+        'paragraphs': [p.text.strip() for p in soup.find_all('p')],
+    }
+
+
+class _ArticleTarget:
+    """Parser target collecting the firstHeading text and the text of every <p>; builds no tree."""
+
+    def __init__(self):
+        self.title = None
+        self.paragraphs = []
+        # 当前打开的 <p> 各自的文本片段（<p> 可能嵌套，外层也包含内层文本）
+        self._open_paragraphs = []
+        self._heading = None
+        self._h1_depth = 0
+
+    def start(self, tag, attrib):
+        if tag == 'p':
+            self._open_paragraphs.append([])
+        elif tag == 'h1':
+            self._h1_depth += 1
+            if self.title is None and self._heading is None and attrib.get('id') == 'firstHeading':
+                self._heading = ([], self._h1_depth)
+
+    def end(self, tag):
+        if tag == 'p' and self._open_paragraphs:
+            self.paragraphs.append(''.join(self._open_paragraphs.pop()).strip())
+        elif tag == 'h1' and self._h1_depth:
+            if self._heading is not None and self._heading[1] == self._h1_depth:
+                self.title = ''.join(self._heading[0])
+                self._heading = None
+            self._h1_depth -= 1
+
+    def data(self, data):
+        for parts in self._open_paragraphs:
+            parts.append(data)
+        if self._heading is not None:
+            self._heading[0].append(data)
+
+    def comment(self, text):
+        pass
+
+    def close(self):
+        if self.title is None:
+            return None
+        return {'title': self.title, 'paragraphs': self.paragraphs}
+
+
+def extract_article_stream(html_content):
+    if isinstance(html_content, str):
+        html_content = html_content.encode('utf-8')
+    # libxml2 在没有 meta charset 时按 latin-1 解码；能按 UTF-8 解码就直接指定 UTF-8
+    try:
+        html_content.decode('utf-8')
+        encoding = 'utf-8'
+    except UnicodeDecodeError:
+        encoding = None
+    # target 接收的是 start / data / end 事件，lxml 不会为文档建立任何元素
+    parser = etree.HTMLParser(target=_ArticleTarget(), recover=True, encoding=encoding)
+    parser.feed(html_content)
+    return parser.close()
+
+
+def extract_article_selectolax(html_content):
+    tree = LexborHTMLParser(html_content)
+    heading = tree.css_first('h1#firstHeading')
+    if heading is None:
+        return None
+    return {
+        'title': heading.text(),
+        'paragraphs': [p.text().strip() for p in tree.css('p')],
+    }
+
+
+def available_extractors():
+    extractors = {'bs4': extract_article_bs4}
+    if etree is not None:
+        extractors['bs4-lxml'] = lambda html_content: extract_article_bs4(html_content, 'lxml')
+        extractors['lxml-stream'] = extract_article_stream
+    if LexborHTMLParser is not None:
+        extractors['selectolax'] = extract_article_selectolax
+    return extractors
+
+
+def default_extractor():
+    if etree is not None:
+        return 'lxml-stream'
+    if LexborHTMLParser is not None:
+        return 'selectolax'
+    return 'bs4'
@@ -0,0 +1,189 @@
+"""
+Append-only JSONL shards for scraped documents.
+
+    <dir>/<prefix>-00000.jsonl[.gz]   one compact JSON record per line; a new shard is started
+                                      once the current one reaches max_bytes
+    <dir>/<prefix>.index.jsonl        one line per record: {"key", "shard", "offset", "length"},
+                                      or {"key", "deleted": true} for a deletion
+
+With compress="gzip" every record is its own gzip member: the shard is still a valid .gz file and
+each record stays seekable through its (offset, length). Writing a key again supersedes the older
+record; readers only return the latest live record per key.
+"""
+import glob
+import gzip
+import json
+import os
+import re
+
+INDEX_SUFFIX = '.index.jsonl'
+
+
+def shard_name(prefix, number, compress=None):
+    return f'{prefix}-{number:05d}.jsonl' + ('.gz' if compress == 'gzip' else '')
+
+
+def shard_files(directory, prefix):
+    return sorted(glob.glob(os.path.join(directory, f'{prefix}-[0-9][0-9][0-9][0-9][0-9].jsonl*')))
+
+
+def shard_number(path):
+    return int(re.search(r'-(\d{5})\.jsonl', os.path.basename(path)).group(1))
+
+
+def _read_index(path):
+    """Returns (entries, byte offset just past the last complete index line)."""
+    entries = []
+    end = 0
+    with open(path, 'rb') as f:
+        for line in f:
+            if not line.endswith(b'\n'):
+                # 写入中断留下的半行，忽略
+                break
+            if line.strip():
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    break
+            end += len(line)
+    return entries, end
+
+
+def read_index(path):
+    return _read_index(path)[0]
+
+
+class ShardWriter:
+    """Appends records to rolling shards; reopening an existing directory continues where it stopped."""
+
+    def __init__(self, directory, prefix='wiki', max_bytes=64 * 2**20, compress=None):
+        if compress not in (None, 'gzip'):
+            raise ValueError(f"compress: {compress} must be either None or (gzip)")
+        self.directory = directory
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.compress = compress
+        os.makedirs(directory, exist_ok=True)
+
+        self.index_path = os.path.join(directory, prefix + INDEX_SUFFIX)
+        entries, index_end = _read_index(self.index_path) if os.path.exists(self.index_path) else ([], 0)
+        ends = {}
+        for entry in entries:
+            if 'shard' in entry:
+                ends[entry['shard']] = max(ends.get(entry['shard'], 0), entry['offset'] + entry['length'])
+        existing = shard_files(directory, prefix)
+        # 编号取现有文件名中的最大值，不假设编号连续
+        self.number = max((shard_number(path) for path in existing), default=0)
+        if existing and not os.path.exists(os.path.join(directory, shard_name(prefix, self.number, compress))):
+            # 压缩方式改变时另起一个 shard
+            self.number += 1
+
+        self.path = os.path.join(directory, shard_name(prefix, self.number, compress))
+        self.file = open(self.path, 'ab')
+        if os.path.exists(self.index_path):
+            # 索引是已提交写入的依据：截掉最后一个 shard 里没有进索引的残缺尾部
+            self.file.truncate(ends.get(os.path.basename(self.path), 0))
+            self.file.seek(0, os.SEEK_END)
+            # 同样截掉索引末尾的半行，否则后续条目会接在半行后面而读不到
+            with open(self.index_path, 'r+b') as f:
+                f.truncate(index_end)
+        self.index = open(self.index_path, 'a', encoding='utf-8')
+
+    def _roll(self):
+        self.file.close()
+        self.number += 1
+        self.path = os.path.join(self.directory, shard_name(self.prefix, self.number, self.compress))
+        self.file = open(self.path, 'ab')
+
+    def append(self, record, key=None):
+        """Appends one record; returns its index entry."""
+        data = (json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
+        if self.compress == 'gzip':
+            data = gzip.compress(data)
+        if self.file.tell() and self.file.tell() + len(data) > self.max_bytes:
+            self._roll()
+        entry = {'key': key, 'shard': os.path.basename(self.path), 'offset': self.file.tell(), 'length': len(data)}
+        self.file.write(data)
+        # 先写数据再写索引，索引中的记录一定完整
+        self.file.flush()
+        self.index.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self.index.flush()
+        return entry
+
+    def delete(self, key):
+        self.index.write(json.dumps({'key': key, 'deleted': True}, ensure_ascii=False) + '\n')
+        self.index.flush()
+
+    def close(self):
+        self.file.close()
+        self.index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class ShardReader:
+    """Streams the records of every shard set (<prefix>.index.jsonl) in a directory, in shard/offset order."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.index_paths = sorted(glob.glob(os.path.join(directory, '*' + INDEX_SUFFIX)))
+
+    def files(self):
+        """Index and shard files, e.g. for change detection."""
+        paths = list(self.index_paths)
+        for index_path in self.index_paths:
+            prefix = os.path.basename(index_path)[:-len(INDEX_SUFFIX)]
+            paths.extend(shard_files(self.directory, prefix))
+        return paths
+
+    def entries(self, latest_only=True):
+        entries = []
+        for index_path in self.index_paths:
+            entries.extend(read_index(index_path))
+        if latest_only:
+            # 同一 key 以最后一次写入为准，删除标记使其失效；没有 key 的记录全部保留
+            latest = {}
+            unkeyed = []
+            for entry in entries:
+                if entry.get('key') is None:
+                    unkeyed.append(entry)
+                else:
+                    latest[entry['key']] = entry
+            entries = unkeyed + [entry for entry in latest.values() if not entry.get('deleted')]
+        # 按文件内位置排序，顺序读盘
+        return sorted((entry for entry in entries if 'shard' in entry), key=lambda e: (e['shard'], e['offset']))
+
+    def entries_by_shard(self, latest_only=True):
+        """{shard file name: its entries in offset order}, e.g. to process shards one at a time."""
+        by_shard = {}
+        for entry in self.entries(latest_only):
+            by_shard.setdefault(entry['shard'], []).append(entry)
+        return by_shard
+
+    def __iter__(self):
+        return self.iter_records()
+
+    def iter_records(self, latest_only=True, entries=None):
+        """Records of entries (default: self.entries(latest_only))."""
+        if entries is None:
+            entries = self.entries(latest_only)
+        current_name, f = None, None
+        try:
+            for entry in entries:
+                if entry['shard'] != current_name:
+                    if f is not None:
+                        f.close()
+                    current_name = entry['shard']
+                    f = open(os.path.join(self.directory, current_name), 'rb')
+                f.seek(entry['offset'])
+                data = f.read(entry['length'])
+                if current_name.endswith('.gz'):
+                    data = gzip.decompress(data)
+                yield json.loads(data)
+        finally:
+            if f is not None:
+                f.close()